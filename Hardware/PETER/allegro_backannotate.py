@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Google LLC. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Works out the pin and function swaps made in Allegro, so that they can be
+# back-annotated into the KiCad schematic.
+#
+# The swaps are found by comparing the netlist that Allegro exports after
+# swapping ("Netlist w/ Properties", which is in the same Telesis format as
+# allegro_netlist.py's output) against the original KiCad netlist. Both are
+# indexed by refdes.pin in a single pass each, and the pins of each component
+# whose net changed are then matched up with each other:
+#   - Function swaps: a group of a func_* function whose pins now carry the nets
+#     of another group of the same function (in any order).
+#   - Pin swaps: pins that now carry each other's nets. These are reduced to the
+#     minimal list of pairwise swaps: a cycle of n pins takes n-1 swaps.
+#   - Net changes: pins whose new net wasn't on any other changed pin of the
+#     component, i.e. connectivity that was changed in Allegro rather than
+#     swapped. These need to be looked at by hand.
+# Pins are also described by the Telesis pin names the converter emitted, so
+# that changes can be matched up with the PINORDER/FUNCTION definitions in the
+# device files.
+#
+# Pinswap reports can be given as well. Their exact layout depends on the
+# Allegro version, so any line that mentions two pins of the same component
+# (as refdes.pin) is taken as a swap of those pins; a function swap matches if
+# any of the pairs of pins it trades is reported. Reported swaps are marked in
+# the change list, and swaps that were reported but that aren't reflected in
+# the netlist are listed as warnings.
+#
+# The change list is written out as JSON: a list of per-pin net changes (which
+# is enough to apply the changes, e.g. by renaming nets on the schematic
+# symbol's pins), and the swaps and net changes that they decompose into.
+
+import argparse
+import json
+import re
+import sys
+
+# Import the converter that lives alongside this script.
+sys.dont_write_bytecode = True
+import allegro_netlist
+import telesis
+
+# Matches a refdes.pin node in a pinswap report
+_NODE = re.compile(r"^([^.\s,;']+)\.([^\s,;']+)$")
+
+def read_telesis_nets(f):
+  # Reads the nets of a Telesis netlist from a file object, returning a dict of
+  # (refdes, pin) to net name. Net names are uppercased and unquoted; see
+  # net_key.
+  nets = {}
+  for name, nodes in telesis.read_netlist(f).nets.items():
+    name = net_key(name)
+    for node in nodes:
+      ref, sep, pin = node.partition('.')
+      if sep:
+        nets[ref, pin] = name
+  return nets
+
+def net_key(name):
+  # Normalizes a Telesis net name for comparison, since net names are case
+  # insensitive and only quoted when necessary.
+  return name.strip("'").upper()
+
+def read_swap_report(f):
+  # Reads an Allegro pinswap report from a file object, returning a set of
+  # (refdes, frozenset of two pins) swaps.
+  swaps = set()
+  for line in f:
+    nodes = [m.groups() for m in map(_NODE.match,
+                                     line.replace(',', ' ').split()) if m]
+    for i in range(len(nodes) - 1):
+      (ref, pin), (other_ref, other_pin) = nodes[i], nodes[i + 1]
+      if ref == other_ref and pin != other_pin:
+        swaps.add((ref, frozenset((pin, other_pin))))
+  return swaps
+
+def cycles(mapping):
+  # Decomposes a permutation, as a dict of item to the item whose value it
+  # takes, into cycles. Items that map to themselves are left out.
+  seen = set()
+  out = []
+  for start in mapping:
+    if start in seen or mapping[start] == start:
+      continue
+    cycle = []
+    item = start
+    while item not in seen and item in mapping:
+      seen.add(item)
+      cycle.append(item)
+      item = mapping[item]
+    out.append(cycle)
+  return out
+
+def transpositions(cycle):
+  # Returns the minimal list of pairwise swaps that carries out a cycle, where
+  # each item takes the value of the next one.
+  return [(cycle[i], cycle[i + 1]) for i in range(len(cycle) - 1)]
+
+class BackAnnotator:
+  # Compares a KiCad netlist with the netlist exported by Allegro.
+  def __init__(self, nl, options=None):
+    self.nl = nl
+    self.converter = allegro_netlist.Converter(options)
+    enc = self.converter.enc
+    # Dict of (refdes, pin) to converted net name, and of converted net names
+    # back to KiCad net names
+    self.nets = {}
+    self.kicad_names = {}
+    # Number of nodes of each converted net
+    self.sizes = {}
+    for net in nl.nets:
+      name = net_key(enc.net(net.name))
+      self.kicad_names[name] = net.name
+      self.sizes[name] = len(net.nodes)
+      for node in net.nodes:
+        self.nets[node] = name
+    self.components = {c.ref: c for c in nl.components}
+    # Dict of LibPart.key to a dict of pin number to pin name
+    self._pin_names = {}
+
+  def functions(self, comp):
+    # Returns the resolved functions of a component, as a list of (function
+    # name, groups of pin numbers) tuples.
+    index = allegro_netlist.group_field_index([comp])
+    functions, _, _ = self.converter.libpart_cache.resolve(comp.libpart, [
+      (func, allegro_netlist.get_group_field(
+        self.converter.enc, index, 'func_' + func, sanitize=False))
+      for func in allegro_netlist.find_group_functions(index)])
+    return [(func, [[p.num for p in group] for group in groups])
+            for func, groups, _ in functions]
+
+  def pin_info(self, comp, pin):
+    # Returns the name and Telesis name of a pin of a component.
+    libpart = comp.libpart
+    names = self._pin_names.get(libpart.key)
+    if names is None:
+      names = self._pin_names[libpart.key] = {}
+      for p in libpart.pins or ():
+        names.setdefault(p.num, p.name)
+    name = names.get(pin, '')
+    return name, self.converter.enc.pin(name, pin)
+
+  def compare(self, allegro_nets, reported=()):
+    # Compares the Allegro netlist (as read by read_telesis_nets) with the KiCad
+    # netlist. Returns a change list (see above) and a list of warnings.
+    warnings = []
+    # Changed pins, grouped by component: dict of refdes to a dict of pin to
+    # (old net, new net)
+    changed = {}
+    for node, old in self.nets.items():
+      new = allegro_nets.get(node)
+      if new is None and self.sizes[old] == 1:
+        # Allegro leaves out unconnected pins
+        continue
+      if new != old:
+        changed.setdefault(node[0], {})[node[1]] = (old, new)
+    for node in allegro_nets:
+      if node not in self.nets:
+        warnings.append('%s.%s is not in the KiCad netlist' % node)
+    reported = set(reported)
+    changes = {'pins': [], 'function_swaps': [], 'pin_swaps': [],
+               'net_changes': []}
+    for ref in sorted(changed, key=allegro_netlist.natural_sort_key):
+      pins = changed[ref]
+      comp = self.components.get(ref)
+      for pin in sorted(pins, key=allegro_netlist.natural_sort_key):
+        old, new = pins[pin]
+        name, telesis_name = (self.pin_info(comp, pin) if comp
+                              else ('', ''))
+        changes['pins'].append({
+          'ref': ref, 'pin': pin, 'name': name, 'telesis_pin': telesis_name,
+          'old_net': self.kicad_names.get(old, old),
+          'new_net': self.kicad_names.get(new, new)})
+      self._decompose(ref, comp, pins, changes, reported)
+    for ref, swap in sorted(reported, key=lambda s: (
+        allegro_netlist.natural_sort_key(s[0]), sorted(s[1]))):
+      a, b = sorted(swap)
+      warnings.append('reported swap of %s.%s and %s.%s is not in the netlist'
+                      % (ref, a, ref, b))
+    return changes, warnings
+
+  def _decompose(self, ref, comp, pins, changes, reported):
+    # Breaks the changed pins of a component down into function swaps, pin
+    # swaps, and net changes. Reported swaps that are found are removed from
+    # reported.
+    # Current net of each pin, starting from the KiCad netlist and updated as
+    # swaps are applied
+    state = {pin: old for pin, (old, _) in pins.items()}
+    target = {pin: new for pin, (_, new) in pins.items()}
+    def net_of(pin):
+      return state.get(pin, self.nets.get((ref, pin)))
+    def target_of(pin):
+      return target.get(pin, self.nets.get((ref, pin)))
+    # Function swaps: groups whose pins take the nets of another group
+    for func, groups in self.functions(comp) if comp and comp.libpart.pins \
+        else ():
+      if len(groups) < 2 or not any(p in pins for g in groups for p in g):
+        continue
+      originals = {}
+      for i, group in enumerate(groups):
+        originals.setdefault(tuple(sorted(map(str, map(net_of, group)))), i)
+      mapping = {}
+      for j, group in enumerate(groups):
+        key = tuple(sorted(str(target_of(p)) for p in group))
+        i = originals.get(key)
+        if i is not None:
+          mapping[j] = i
+      if sorted(mapping.values()) != sorted(mapping):
+        # Not a permutation of groups
+        continue
+      for a, b in sum((transpositions(c) for c in cycles(mapping)), []):
+        # Reports may name any of the pairs of pins that trade places
+        swaps = {(ref, frozenset(p)) for p in zip(groups[a], groups[b])}
+        changes['function_swaps'].append({
+          'ref': ref, 'function': func.upper(), 'groups': [a + 1, b + 1],
+          'pins': [list(p) for p in zip(groups[a], groups[b])],
+          'reported': not swaps.isdisjoint(reported)})
+        reported.difference_update(swaps)
+        for p, q in zip(groups[a], groups[b]):
+          state[p], state[q] = net_of(q), net_of(p)
+    # Pin swaps: each changed pin takes the net of another changed pin
+    by_net = {}
+    for pin in sorted(pins, key=allegro_netlist.natural_sort_key):
+      if state[pin] != target[pin]:
+        by_net.setdefault(state[pin], []).append(pin)
+    mapping = {}
+    for pin in sorted(pins, key=allegro_netlist.natural_sort_key):
+      if state[pin] != target[pin] and by_net.get(target[pin]):
+        mapping[pin] = by_net[target[pin]].pop(0)
+    for cycle in cycles(mapping):
+      if len(cycle) < 2 or mapping.get(cycle[-1]) != cycle[0]:
+        # Not a closed cycle; left over as net changes
+        continue
+      for a, b in transpositions(cycle):
+        swap = (ref, frozenset((a, b)))
+        changes['pin_swaps'].append({
+          'ref': ref, 'pins': [a, b],
+          'telesis_pins': [self.pin_info(comp, a)[1] if comp else '',
+                           self.pin_info(comp, b)[1] if comp else ''],
+          'reported': swap in reported})
+        reported.discard(swap)
+        state[a], state[b] = state[b], state[a]
+    # Anything else changed connectivity
+    for pin in sorted(pins, key=allegro_netlist.natural_sort_key):
+      if state[pin] != target[pin]:
+        changes['net_changes'].append({
+          'ref': ref, 'pin': pin,
+          'old_net': self.kicad_names.get(state[pin], state[pin]),
+          'new_net': self.kicad_names.get(target[pin], target[pin])})
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description='Work out the pin and function swaps made in Allegro, for '
+                'back-annotation into KiCad.')
+  parser.add_argument('netlist',
+                      help='original KiCad XML netlist, or root .kicad_sch '
+                           'schematic')
+  parser.add_argument('allegro_netlist',
+                      help='netlist exported by Allegro after swapping '
+                           '("Netlist w/ Properties")')
+  parser.add_argument('-r', '--report', action='append', default=[],
+                      help='Allegro pinswap report to cross-check against '
+                           '(can be given more than once)')
+  parser.add_argument('-o', '--output',
+                      help='file to write the JSON change list to (default: '
+                           'standard output)')
+  parser.add_argument('--escape', action='store_true',
+                      help='the netlist was converted with --escape')
+  args = parser.parse_args(argv)
+  nl = allegro_netlist.load_netlist(args.netlist)
+  with open(args.allegro_netlist) as f:
+    allegro_nets = read_telesis_nets(f)
+  reported = set()
+  for path in args.report:
+    with open(path) as f:
+      reported |= read_swap_report(f)
+  annotator = BackAnnotator(nl, allegro_netlist.Options(escape=args.escape))
+  changes, warnings = annotator.compare(allegro_nets, reported)
+  for warning in warnings:
+    sys.stderr.write('warning: %s\n' % warning)
+  sys.stderr.write('%u pins changed: %u function swaps, %u pin swaps, '
+                   '%u net changes\n' % (
+                     len(changes['pins']), len(changes['function_swaps']),
+                     len(changes['pin_swaps']), len(changes['net_changes'])))
+  text = json.dumps(changes, indent=2) + '\n'
+  if args.output:
+    with open(args.output, 'w') as f:
+      f.write(text)
+  else:
+    sys.stdout.write(text)
+
+if __name__ == '__main__':
+  main()
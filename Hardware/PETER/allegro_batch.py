@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Google LLC. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Converts several KiCad XML netlists into Allegro netlists in a single process.
+# The boards in this repository reuse many of the same library symbols, so all
+# the projects share a single cache of resolved library part data (pin lists,
+# function/pinswap groups, and footprints), rather than resolving them from
+# scratch for each board. Schematics (.kicad_sch) can be given instead of
+# netlists, in which case the projects also share a cache of parsed sheets.
+# The sheet cache can be kept between runs with --sheet-cache. Projects can be
+# converted concurrently with --jobs, and a summary of the timings and cache
+# hits of each project is printed at the end.
+#
+# Each project's netlist.txt and devices directory are written next to its
+# netlist, or into a directory per project (named after the netlist) if an
+# output directory is specified.
+
+import argparse
+import concurrent.futures
+import os
+import sys
+import time
+
+# Import the converter that lives alongside this script.
+sys.dont_write_bytecode = True
+import allegro_netlist
+import kicad_sch
+
+class Project:
+  # The conversion of a single netlist.
+  def __init__(self, src, output):
+    self.name = os.path.splitext(os.path.basename(src))[0]
+    self.src = src
+    self.output = output
+    self.conversion = None
+    self.cache_stats = None
+    # The exception the conversion failed with, if any
+    self.error = None
+    # Time spent loading, converting, and writing out the netlist, in seconds
+    self.times = (0.0, 0.0, 0.0)
+
+  def convert(self, options, libpart_cache, sheet_cache):
+    start = time.perf_counter()
+    nl = allegro_netlist.load_netlist(self.src, sheet_cache)
+    loaded = time.perf_counter()
+    converter = allegro_netlist.Converter(options, libpart_cache)
+    self.conversion = converter.convert(nl)
+    self.cache_stats = converter.cache_stats
+    converted = time.perf_counter()
+    if self.conversion.collisions:
+      # Don't write out anything; see allegro_netlist.convert
+      return self
+    self.conversion.write(self.output, options.incremental)
+    self.times = (loaded - start, converted - loaded,
+                  time.perf_counter() - converted)
+    return self
+
+def format_times(times):
+  return 'load %.3f s, convert %.3f s, write %.3f s' % times
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description='Convert several KiCad XML netlists or schematics into '
+                'Allegro (Telesis) netlists, sharing library part data '
+                'between them.')
+  parser.add_argument('netlists', nargs='+',
+                      help='KiCad XML netlists, or root .kicad_sch schematics')
+  parser.add_argument('-o', '--output-dir',
+                      help='write each project into a directory named after '
+                           'its netlist here, instead of next to the netlist')
+  parser.add_argument('-j', '--jobs', type=int, default=1,
+                      help='number of projects to convert concurrently in '
+                           'threads (default: 1, i.e. serially); conversion '
+                           'is mostly CPU bound, so this rarely helps')
+  parser.add_argument('--sheet-cache',
+                      help='file to load parsed schematic sheets from and save '
+                           'them to, so that unchanged sheets are not parsed '
+                           'again')
+  allegro_netlist.add_option_arguments(parser, jobs=False)
+  args = parser.parse_args(argv)
+  for src in args.netlists:
+    if not os.path.isfile(src):
+      sys.stderr.write('KiCAD netlist not found: %s\n' % src)
+      sys.exit(1)
+  # Projects are converted in threads so they can share the cache; device files
+  # within a project are generated serially.
+  options = allegro_netlist.options_from_args(args)
+  options.jobs = 1
+  libpart_cache = allegro_netlist.LibPartCache()
+  sheet_cache = kicad_sch.SheetCache()
+  if args.sheet_cache:
+    sheet_cache.load(args.sheet_cache)
+  projects = [Project(src, output) for src, output in zip(
+    args.netlists, allegro_netlist.project_outputs(args.netlists,
+                                                   args.output_dir))]
+  start = time.perf_counter()
+  with concurrent.futures.ThreadPoolExecutor(max(1, args.jobs)) as pool:
+    futures = [pool.submit(p.convert, options, libpart_cache, sheet_cache)
+               for p in projects]
+    # Report errors rather than stopping, so the other projects still get
+    # converted and summarized, and the sheet cache still gets saved
+    for project, future in zip(projects, futures):
+      try:
+        future.result()
+      except Exception as e:
+        project.error = e
+  elapsed = time.perf_counter() - start
+  if args.sheet_cache:
+    sheet_cache.save(args.sheet_cache)
+  # Report on each project, in the order given
+  failed = False
+  for project in projects:
+    if project.error:
+      sys.stderr.write('%s: conversion failed: %s\n' % (project.name,
+                                                         project.error))
+      failed = True
+      continue
+    conv = project.conversion
+    if conv.collisions:
+      for line in conv.collision_report().splitlines():
+        sys.stderr.write('%s: %s\n' % (project.name, line))
+      failed = True
+      continue
+    for warning in conv.warnings:
+      print('%s: %s' % (project.name, warning))
+    if args.incremental:
+      allegro_netlist.report_status(conv, '%s: ' % project.name)
+    print('%s: %s; %u packages, %u device files, %u nets; '
+          'libpart cache %u hits, %u misses' % (
+            project.name, format_times(project.times), len(conv.packages),
+            len(conv.devices), len(conv.nets), project.cache_stats.hits,
+            project.cache_stats.misses))
+  stats = libpart_cache.stats
+  print('total: %u projects in %.3f s (%s); '
+        'libpart cache %u hits, %u misses' % (
+          len(projects), elapsed,
+          format_times(tuple(sum(t) for t in
+                             zip(*(p.times for p in projects)))),
+          stats.hits, stats.misses))
+  if sheet_cache.hits or sheet_cache.misses:
+    print('sheet cache: %u hits, %u misses' % (sheet_cache.hits,
+                                               sheet_cache.misses))
+  if failed:
+    sys.exit(1)
+
+if __name__ == '__main__':
+  main()
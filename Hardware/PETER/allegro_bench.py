@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Google LLC. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Benchmarks allegro_netlist.py on synthetic KiCad XML netlists.
+#
+# Netlists are generated from a seed, so the same parameters always produce the
+# same netlist. Each netlist is a mix of passives (resistors and capacitors,
+# with a configurable number of distinct values) and ICs (with a configurable
+# number of pins and func_* pinswap definitions), spread across a number of
+# sheets.
+# Component pins are connected to randomly chosen nets.
+#
+# Each conversion is timed phase by phase: loading the netlist, grouping the
+# components, generating the packages and device files, and collecting the nets
+# and rooms. Times are the best of several runs. Peak memory (as seen by
+# tracemalloc) is measured in a separate run, since tracing slows everything
+# down. The number of bytes of output produced by each phase is reported as
+# well.
+#
+# The output of each scenario is compared against a golden file, named after the
+# scenario parameters, so that optimizations can be checked to not change the
+# output. Golden files are written with --update-golden. Results can be saved as
+# JSON and compared against a previous run with --compare.
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from xml.sax.saxutils import escape, quoteattr
+
+# Import the converter that lives alongside this script.
+sys.dont_write_bytecode = True
+import allegro_netlist
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'bench', 'golden')
+PHASES = ('load', 'grouping', 'devices', 'nets', 'rooms')
+# Number of distinct IC library parts
+IC_TYPES = 8
+# Fraction of components that are passives
+PASSIVE_FRACTION = 0.7
+
+class Scenario:
+  # The parameters of a synthetic netlist.
+  def __init__(self, components, nets=None, pins=16, funcs=2, values=8,
+               sheets=8, seed=1):
+    self.components = components
+    self.nets = nets or components
+    # Pins per IC
+    self.pins = pins
+    # Number of func_* definitions per IC
+    self.funcs = funcs
+    # Number of distinct values per kind of passive
+    self.values = values
+    self.sheets = max(1, sheets)
+    self.seed = seed
+
+  def name(self):
+    return 'c%u_n%u_p%u_f%u_v%u_s%u_seed%u' % (
+      self.components, self.nets, self.pins, self.funcs, self.values,
+      self.sheets, self.seed)
+
+  def params(self):
+    return dict(vars(self))
+
+def _field(name, value):
+  return '<field name=%s>%s</field>' % (quoteattr(name), escape(value))
+
+def _ic_pins(scenario):
+  # Returns the pin names of an IC and its func_* definitions. Each function
+  # swaps two banks of pins, and pins within a bank can be swapped as well.
+  bank = scenario.pins // (2 * scenario.funcs + 2) if scenario.funcs else 0
+  names = []
+  funcs = []
+  for f in range(scenario.funcs if bank else 0):
+    for g in range(2):
+      names.extend('B%u_%u_%u' % (f, g, i) for i in range(bank))
+    funcs.append(('func_bank%u' % f, r'B%u_0_\d+;B%u_1_\d+;;*' % (f, f)))
+  names.extend('P%u' % i for i in range(len(names), scenario.pins))
+  return names, funcs
+
+def generate_netlist(f, scenario):
+  # Writes a synthetic KiCad XML netlist to a file object.
+  rng = random.Random(scenario.seed)
+  sheets = ['/'] + ['/Sheet%u/' % i for i in range(1, scenario.sheets)]
+  ic_pins, ic_funcs = _ic_pins(scenario)
+  passives = {'R': ['%uk' % (i + 1) for i in range(scenario.values)],
+              'C': ['%unF' % (10 * (i + 1)) for i in range(scenario.values)]}
+  footprints = {'R': 'Resistor_SMD:R_0603_1608Metric',
+                'C': 'Capacitor_SMD:C_0603_1608Metric'}
+  w = f.write
+  w('<?xml version="1.0" encoding="UTF-8"?>\n<export version="E">\n')
+  w('<design><source>%s.kicad_sch</source><date>synthetic</date></design>\n' %
+    scenario.name())
+  # Components, and the pins of each
+  pins = []
+  counts = {}
+  w('<components>\n')
+  for i in range(scenario.components):
+    sheet = i % len(sheets)
+    if rng.random() < PASSIVE_FRACTION:
+      part = rng.choice('RC')
+      value = rng.choice(passives[part])
+      footprint = footprints[part]
+      fields = _field('Tolerance', '10%' if part == 'C' else '1%')
+      npins = 2
+    else:
+      part = 'IC%u' % rng.randrange(IC_TYPES)
+      value = part
+      footprint = ''
+      fields = _field('mpn', 'MPN-%s' % part)
+      npins = scenario.pins
+    prefix = part if part in passives else 'U'
+    counts[prefix] = counts.get(prefix, 0) + 1
+    ref = '%s%u' % (prefix, counts[prefix])
+    pins.extend((ref, str(p + 1)) for p in range(npins))
+    w('<comp ref=%s><value>%s</value><footprint>%s</footprint>'
+      '<fields>%s</fields><libsource lib="Synthetic" part=%s/>'
+      '<sheetpath names=%s tstamps=%s/></comp>\n' % (
+        quoteattr(ref), escape(value), escape(footprint), fields,
+        quoteattr(part), quoteattr(sheets[sheet]), quoteattr(sheets[sheet])))
+  w('</components>\n')
+  # Library parts
+  w('<libparts>\n')
+  for part in passives:
+    w('<libpart lib="Synthetic" part=%s><fields>%s</fields>'
+      '<footprints><fp>%s_*</fp></footprints><pins>%s</pins></libpart>\n' % (
+        quoteattr(part), _field('Reference', part), part,
+        ''.join('<pin num="%u" name="~" type="passive"/>' % (p + 1)
+                for p in range(2))))
+  for t in range(IC_TYPES):
+    w('<libpart lib="Synthetic" part="IC%u"><fields>%s</fields>'
+      '<footprints><fp>QFP-%u</fp><fp>QFN-%u</fp></footprints>'
+      '<pins>%s</pins></libpart>\n' % (
+        t, _field('Reference', 'U') + ''.join(
+          _field(name, spec) for name, spec in ic_funcs),
+        scenario.pins, scenario.pins,
+        ''.join('<pin num="%u" name=%s type="bidirectional"/>' % (
+          p + 1, quoteattr(name)) for p, name in enumerate(ic_pins))))
+  w('</libparts>\n')
+  # Nets. Every net gets at least one pin, if there are enough pins to go
+  # around, and the remaining pins are connected at random.
+  rng.shuffle(pins)
+  nodes = [[] for _ in range(scenario.nets)]
+  for i, pin in enumerate(pins):
+    nodes[i if i < len(nodes) else rng.randrange(len(nodes))].append(pin)
+  w('<nets>\n')
+  for i, net in enumerate(nodes):
+    # Mix global nets with nets local to a sheet
+    name = ('SIG%u' % i if i % 2 else
+            '%sN%u' % (sheets[i % len(sheets)], i))
+    w('<net code="%u" name=%s>%s</net>\n' % (
+      i + 1, quoteattr(name), ''.join(
+        '<node ref=%s pin="%s"/>' % (quoteattr(ref), num) for ref, num in net)))
+  w('</nets>\n</export>\n')
+
+def run(path, options, measure_memory=False):
+  # Converts a netlist phase by phase. Returns the Conversion and a dict of
+  # phase to (seconds, peak bytes allocated, output bytes). Peak bytes are None
+  # unless measure_memory is set.
+  results = {}
+  def phase(name, fn, *args):
+    if measure_memory:
+      tracemalloc.reset_peak()
+      base = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    out = fn(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] - base if measure_memory else None
+    results[name] = [elapsed, peak, 0]
+    return out
+  if measure_memory:
+    tracemalloc.start()
+  try:
+    nl = phase('load', allegro_netlist.load_netlist, path)
+    groups = phase('grouping', nl.group_components)
+    converter = allegro_netlist.Converter(options)
+    conv = allegro_netlist.Conversion(nl.source, nl.date)
+    phase('devices', converter.collect_packages, conv, groups)
+    phase('nets', converter.collect_nets, conv, nl)
+    phase('rooms', converter.collect_rooms, conv, nl)
+  finally:
+    if measure_memory:
+      tracemalloc.stop()
+  results['devices'][2] = len(conv.packages_section().encode()) + sum(
+    len(d.encode()) for d in conv.devices.values())
+  results['nets'][2] = len(conv.nets_section().encode())
+  results['rooms'][2] = len(conv.rooms_section().encode())
+  return conv, results
+
+def format_output(conv):
+  # Returns the netlist and all the device files of a Conversion as one string,
+  # for comparison against golden files.
+  out = ['==> netlist.txt <==\n', conv.netlist()]
+  for device_type in sorted(conv.devices):
+    out.append('==> devices/%s.txt <==\n' % device_type)
+    out.append(conv.devices[device_type])
+  return ''.join(out)
+
+def check_golden(name, output, golden_dir, update):
+  # Compares output against a scenario's golden file, or writes the golden file
+  # if update is set. Returns 'match', 'mismatch', 'missing', or 'updated'.
+  path = os.path.join(golden_dir, name + '.txt')
+  if update:
+    os.makedirs(golden_dir, exist_ok=True)
+    with open(path, 'w', newline='') as f:
+      f.write(output)
+    return 'updated'
+  if not os.path.isfile(path):
+    return 'missing'
+  with open(path, newline='') as f:
+    return 'match' if f.read() == output else 'mismatch'
+
+def benchmark(scenario, options, workdir, repeat=3, golden_dir=GOLDEN_DIR,
+              update_golden=False):
+  # Generates and converts a scenario's netlist, returning a dict of results.
+  path = os.path.join(workdir, scenario.name() + '.xml')
+  with open(path, 'w', encoding='utf-8') as f:
+    generate_netlist(f, scenario)
+  times = None
+  for _ in range(max(1, repeat)):
+    conv, results = run(path, options)
+    run_times = {p: results[p][0] for p in PHASES}
+    times = run_times if times is None else {
+      p: min(times[p], run_times[p]) for p in PHASES}
+  _, memory = run(path, options, measure_memory=True)
+  golden_suffix = ''.join(
+    '_' + flag for flag in ('escape', 'consolidate') if getattr(options, flag))
+  return {
+    'scenario': scenario.name(),
+    'params': scenario.params(),
+    'input_bytes': os.path.getsize(path),
+    'phases': {p: {'seconds': times[p], 'peak_bytes': memory[p][1],
+                   'output_bytes': results[p][2]} for p in PHASES},
+    'total_seconds': sum(times.values()),
+    'counts': {'components': scenario.components, 'packages':
+               len(conv.packages), 'devices': len(conv.devices),
+               'nets': len(conv.nets)},
+    'golden': check_golden(scenario.name() + golden_suffix, format_output(conv),
+                           golden_dir, update_golden),
+  }
+
+def print_result(result, baseline=None):
+  print('%s: %u bytes in, %u packages, %u device files, %u nets; golden %s' % (
+    result['scenario'], result['input_bytes'], result['counts']['packages'],
+    result['counts']['devices'], result['counts']['nets'], result['golden']))
+  for p in PHASES + ('total',):
+    if p == 'total':
+      seconds = result['total_seconds']
+      line = '  %-8s %9.4f s' % (p, seconds)
+    else:
+      data = result['phases'][p]
+      seconds = data['seconds']
+      line = '  %-8s %9.4f s %10.1f KiB peak %10u bytes out' % (
+        p, seconds, data['peak_bytes'] / 1024, data['output_bytes'])
+    if baseline:
+      old = (baseline['total_seconds'] if p == 'total'
+             else baseline['phases'][p]['seconds'])
+      if old:
+        line += '  %6.2fx vs baseline' % (seconds / old)
+    print(line)
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description='Benchmark allegro_netlist.py on synthetic KiCad netlists.')
+  parser.add_argument('--sizes', default='100,1000,10000',
+                      help='comma-separated numbers of components, one '
+                           'scenario each (default: %(default)s)')
+  parser.add_argument('--nets', type=int,
+                      help='number of nets (default: number of components)')
+  parser.add_argument('--pins', type=int, default=16,
+                      help='pins per IC (default: %(default)s)')
+  parser.add_argument('--funcs', type=int, default=2,
+                      help='func_* definitions per IC (default: %(default)s)')
+  parser.add_argument('--values', type=int, default=8,
+                      help='distinct values per kind of passive '
+                           '(default: %(default)s)')
+  parser.add_argument('--sheets', type=int, default=8,
+                      help='number of sheets (default: %(default)s)')
+  parser.add_argument('--seed', type=int, default=1,
+                      help='random seed (default: %(default)s)')
+  parser.add_argument('--repeat', type=int, default=3,
+                      help='number of timed runs per scenario; the best time '
+                           'of each phase is reported (default: %(default)s)')
+  allegro_netlist.add_option_arguments(parser)
+  parser.add_argument('--golden-dir', default=GOLDEN_DIR,
+                      help='directory of golden output files '
+                           '(default: bench/golden)')
+  parser.add_argument('--update-golden', action='store_true',
+                      help='write the output of each scenario as its golden '
+                           'file instead of comparing against it')
+  parser.add_argument('--keep',
+                      help='directory to keep the generated netlists in')
+  parser.add_argument('--json', help='file to save the results to')
+  parser.add_argument('--compare',
+                      help='results file of a previous run to compare against')
+  args = parser.parse_args(argv)
+  options = allegro_netlist.options_from_args(args)
+  baseline = {}
+  if args.compare:
+    with open(args.compare) as f:
+      baseline = {r['scenario']: r for r in json.load(f)['results']}
+  results = []
+  with tempfile.TemporaryDirectory() as tmp:
+    workdir = args.keep or tmp
+    os.makedirs(workdir, exist_ok=True)
+    for size in args.sizes.split(','):
+      scenario = Scenario(int(size), args.nets, args.pins, args.funcs,
+                          args.values, args.sheets, args.seed)
+      result = benchmark(scenario, options, workdir, args.repeat,
+                         args.golden_dir, args.update_golden)
+      print_result(result, baseline.get(result['scenario']))
+      results.append(result)
+  if args.json:
+    with open(args.json, 'w') as f:
+      json.dump({'date': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                 'python': platform.python_version(),
+                 'options': vars(options), 'results': results}, f, indent=2)
+      f.write('\n')
+  if any(r['golden'] == 'mismatch' for r in results):
+    sys.stderr.write('output does not match golden files\n')
+    sys.exit(1)
+
+if __name__ == '__main__':
+  main()
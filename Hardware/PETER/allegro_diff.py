@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Google LLC. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Compares two Telesis netlists, along with their device files, and reports
+# what changed in terms of the design rather than lines of text:
+#   - Packages: components that were added or removed, or whose device type,
+#     value, or tolerance changed.
+#   - Nets: nets that were added, removed, renamed, split, or merged, and pins
+#     that moved from one net to another.
+#   - Device files: devices that were added or removed, and changes to their
+#     footprint, class, pin count, functions, and properties.
+#   - Package properties (ROOM) that changed.
+# Nets are compared as sets of nodes. Nets that kept their name and nodes are
+# matched up by hash first, so only the nets that changed are looked at any
+# further, and device files are only parsed if their contents differ.
+#
+# Device files in the new devices directory that the new netlist doesn't use
+# are listed as stale, since they tend to pile up in version control (e.g. after
+# parts change value, or with --consolidate).
+#
+# The exit status is 0 if the netlists are equivalent, and 1 otherwise.
+
+import argparse
+import collections
+import io
+import json
+import os
+import sys
+
+# Import the converter and Telesis helpers that live alongside this script.
+sys.dont_write_bytecode = True
+import allegro_netlist
+import telesis
+
+class Output:
+  # A Telesis netlist and its devices directory.
+  def __init__(self, path):
+    # path is an output directory or netlist file, as given to the converter
+    self.path, self.devdir = allegro_netlist.output_paths(path)
+    with open(self.path) as f:
+      self.netlist = telesis.read_netlist(f)
+    # Dict of device type (lowercase) to device file path
+    self.device_files = {}
+    if os.path.isdir(self.devdir):
+      for name in os.listdir(self.devdir):
+        if name.endswith('.txt'):
+          self.device_files[name[:-4].lower()] = os.path.join(self.devdir,
+                                                              name)
+
+  def used_devices(self):
+    return {d.lower() for d, _, _ in self.netlist.packages.values()}
+
+  def read(self, device_type):
+    # Returns the contents of a device file, or None if it doesn't exist.
+    path = self.device_files.get(device_type)
+    if path is None:
+      return None
+    with open(path) as f:
+      return f.read()
+
+def diff_packages(old, new):
+  # Returns lists of added and removed refs, and a list of (ref, old package,
+  # new package) tuples of changed ones.
+  key = allegro_netlist.natural_sort_key
+  added = sorted(new.keys() - old.keys(), key=key)
+  removed = sorted(old.keys() - new.keys(), key=key)
+  changed = [(ref, old[ref], new[ref]) for ref in sorted(
+    (ref for ref, p in old.items() if ref in new and new[ref] != p), key=key)]
+  return added, removed, changed
+
+def diff_nets(old, new):
+  # Compares two dicts of net name to nodes. Returns a dict of lists of changes:
+  #   added, removed: net names
+  #   renamed: (old name, new name) tuples, for nets with the same nodes
+  #   split: (old name, [new names]) tuples
+  #   merged: ([old names], new name) tuples
+  #   moved: (node, old net, new net) tuples, with None for a node that was
+  #          added or removed
+  # Skip nets with the same name and nodes. Nodes are written out in a
+  # consistent order, so they're compared as lists first, and only as sets if
+  # that fails.
+  old_left = {name: frozenset(nodes) for name, nodes in old.items()
+              if new.get(name) != nodes and
+              frozenset(new.get(name, ())) != frozenset(nodes)}
+  new_left = {name: frozenset(nodes) for name, nodes in new.items()
+              if name not in old or name in old_left}
+  # Renamed nets have the same nodes under another name
+  by_nodes = {nodes: name for name, nodes in new_left.items()}
+  renamed = []
+  for name, nodes in sorted(old_left.items()):
+    other = by_nodes.get(nodes)
+    if other is not None and other != name and other in new_left:
+      renamed.append((name, other))
+  for name, other in renamed:
+    del old_left[name]
+    del new_left[other]
+  # Everything else changed membership; look up where each node went
+  old_of = {node: name for name, nodes in old_left.items() for node in nodes}
+  new_of = {node: name for name, nodes in new_left.items() for node in nodes}
+  changes = {'added': [], 'removed': [], 'renamed': renamed, 'split': [],
+             'merged': [], 'moved': []}
+  # Only names that are gone (or new) count as removed (or added); nets that
+  # kept their name but changed nodes are reported through the moved pins.
+  # A net only split (or merged) if several nets got (or gave) more than one of
+  # its nodes each; anything less, like a swapped pin, is just pins moving.
+  for name, nodes in sorted(old_left.items()):
+    dest = collections.Counter(new_of.get(n) for n in nodes)
+    dest.pop(None, None)
+    if name not in new:
+      changes['removed'].append(name)
+    if sum(count > 1 for count in dest.values()) > 1:
+      changes['split'].append((name, sorted(dest)))
+  for name, nodes in sorted(new_left.items()):
+    src = collections.Counter(old_of.get(n) for n in nodes)
+    src.pop(None, None)
+    if name not in old:
+      changes['added'].append(name)
+    if sum(count > 1 for count in src.values()) > 1:
+      changes['merged'].append((sorted(src), name))
+  for node in sorted(old_of.keys() | new_of.keys(),
+                     key=allegro_netlist.natural_sort_key):
+    a, b = old_of.get(node), new_of.get(node)
+    if a != b:
+      changes['moved'].append((node, a, b))
+  return changes
+
+def diff_device(old, new):
+  # Compares two device files (as read by telesis.read_device). Returns a list
+  # of (what, old, new) tuples.
+  changes = []
+  for what in ('package', 'device_class', 'pincount'):
+    if getattr(old, what) != getattr(new, what):
+      changes.append((what, getattr(old, what), getattr(new, what)))
+  for what in ('pinorder', 'pinswap', 'functions', 'properties'):
+    a, b = getattr(old, what), getattr(new, what)
+    for name in sorted(a.keys() | b.keys()):
+      if a.get(name) != b.get(name):
+        changes.append(('%s %s' % (what, name), a.get(name), b.get(name)))
+  return changes
+
+def diff_properties(old, new):
+  # Compares package properties. Returns a list of (ref, property, old value,
+  # new value) tuples, with None for a property that isn't set.
+  def by_ref(props):
+    out = {}
+    for (prop, value), refs in props.items():
+      for ref in refs:
+        out[ref, prop] = value
+    return out
+  if old == new:
+    return []
+  old, new = by_ref(old), by_ref(new)
+  return [(ref, prop, old.get((ref, prop)), new.get((ref, prop)))
+          for ref, prop in sorted(
+            (k for k in old.keys() | new.keys() if old.get(k) != new.get(k)),
+            key=lambda k: (allegro_netlist.natural_sort_key(k[0]), k[1]))]
+
+def diff(old, new):
+  # Compares two Outputs, returning a dict of changes.
+  added, removed, changed = diff_packages(old.netlist.packages,
+                                          new.netlist.packages)
+  used_old, used_new = old.used_devices(), new.used_devices()
+  devices = {'added': sorted(used_new - used_old),
+             'removed': sorted(used_old - used_new), 'changed': []}
+  for device_type in sorted(used_old & used_new):
+    a, b = old.read(device_type), new.read(device_type)
+    if a == b:
+      continue
+    if a is None or b is None:
+      devices['changed'].append((device_type, [
+        ('file', 'missing' if a is None else 'present',
+         'missing' if b is None else 'present')]))
+      continue
+    devices['changed'].append((device_type, diff_device(
+      telesis.read_device(io.StringIO(a)),
+      telesis.read_device(io.StringIO(b)))))
+  return {
+    'packages': {'added': added, 'removed': removed, 'changed': changed},
+    'nets': diff_nets(old.netlist.nets, new.netlist.nets),
+    'devices': devices,
+    'properties': diff_properties(old.netlist.properties,
+                                  new.netlist.properties),
+    'stale_device_files': sorted(
+      os.path.basename(new.device_files[d])
+      for d in new.device_files.keys() - used_new),
+  }
+
+def has_changes(changes):
+  # Stale device files don't make the netlists different.
+  for key, value in changes.items():
+    if key != 'stale_device_files' and (
+        any(value.values()) if isinstance(value, dict) else value):
+      return True
+  return False
+
+def format_package(p):
+  return '%s!%s!%s' % p
+
+def format_text(changes):
+  out = []
+  packages = changes['packages']
+  for ref in packages['added']:
+    out.append('+ package %s\n' % ref)
+  for ref in packages['removed']:
+    out.append('- package %s\n' % ref)
+  for ref, a, b in packages['changed']:
+    out.append('~ package %s: %s -> %s\n' % (ref, format_package(a),
+                                             format_package(b)))
+  nets = changes['nets']
+  for name in nets['added']:
+    out.append('+ net %s\n' % name)
+  for name in nets['removed']:
+    out.append('- net %s\n' % name)
+  for a, b in nets['renamed']:
+    out.append('~ net %s renamed to %s\n' % (a, b))
+  for name, into in nets['split']:
+    out.append('~ net %s split into %s\n' % (name, ', '.join(into)))
+  for names, name in nets['merged']:
+    out.append('~ nets %s merged into %s\n' % (', '.join(names), name))
+  for node, a, b in nets['moved']:
+    if a is None:
+      out.append('+ pin %s on %s\n' % (node, b))
+    elif b is None:
+      out.append('- pin %s from %s\n' % (node, a))
+    else:
+      out.append('~ pin %s moved from %s to %s\n' % (node, a, b))
+  devices = changes['devices']
+  for d in devices['added']:
+    out.append('+ device %s\n' % d)
+  for d in devices['removed']:
+    out.append('- device %s\n' % d)
+  for d, device_changes in devices['changed']:
+    for what, a, b in device_changes:
+      out.append('~ device %s %s: %s -> %s\n' % (d, what, a, b))
+  for ref, prop, a, b in changes['properties']:
+    out.append('~ %s %s: %s -> %s\n' % (ref, prop, a, b))
+  for name in changes['stale_device_files']:
+    out.append('stale device file: %s\n' % name)
+  return ''.join(out)
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description='Compare two Allegro (Telesis) netlists and their device '
+                'files.')
+  parser.add_argument('old', help='old output directory (or netlist file)')
+  parser.add_argument('new', help='new output directory (or netlist file)')
+  parser.add_argument('--json', action='store_true',
+                      help='report the changes as JSON')
+  args = parser.parse_args(argv)
+  for path in (args.old, args.new):
+    if not os.path.isfile(allegro_netlist.output_paths(path)[0]):
+      sys.stderr.write('Telesis netlist not found: %s\n' % path)
+      sys.exit(2)
+  changes = diff(Output(args.old), Output(args.new))
+  if args.json:
+    sys.stdout.write(json.dumps(changes, indent=2) + '\n')
+  else:
+    sys.stdout.write(format_text(changes))
+  sys.exit(1 if has_changes(changes) else 0)
+
+if __name__ == '__main__':
+  main()
@@ -22,7 +22,9 @@
 
 # WARNING: Allegro is not case sensitive with net names.
 #          Be sure to have the "labels are similar" ERC set to flag an error!
-# TODO: error out if case-mismatched nets make it through
+#          Nets, device files, and pins whose names collide once converted
+#          (e.g., differing only by case, or by characters that get replaced)
+#          are reported as an error, and no output is written.
 
 # NOTE: the Footprint field in KiCad is supposed to be a valid part in the KiCad
 #       library, and needs to be specified as Library:File. This won't work well
@@ -45,7 +47,8 @@
 #       into the schematic somehow. Allegro can export pinswap reports as well
 #       as the effective netlist post-swaps ("Netlist w/ Properties"). These
 #       swaps can either be manually applied back into the schematic or
-#       automatically done so via an additional script. Potential approaches for
+#       automatically done so via an additional script (allegro_backannotate.py
+#       works out the list of swaps to apply). Potential approaches for
 #       automatic back-annotation include renaming nets (not always feasible)
 #       and auto-generating project-local parts with the pins rearranged
 #       (somewhat involved, and doesn't allow for later library updates, but
@@ -75,264 +78,462 @@
 #       match the output of Allegro's "Netlist w/ Properties" output.
 #       In addition, we want to minimize the number of device files created,
 #       since these tend to get added to version control but never cleaned up.
-# TODO: detect extraneous device files in version control and list them out as a
-#       report? Make sure it's not annoying if it's intentional, e.g., multiple
-#       projects/netlists in the same directory. Easiest way for designer to
-#       solve is to just delete the devices directory before generating a
-#       netlist again.
+# NOTE: extraneous device files (ones the netlist no longer uses) are listed as
+#       stale by allegro_diff.py, which also reports the differences between two
+#       netlists in terms of packages, nets, and devices. This is only a report,
+#       since they may be intentional, e.g., multiple projects/netlists in the
+#       same directory. Easiest way for designer to clean up is to just delete
+#       the devices directory before generating a netlist again.
 
 
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import json
+import multiprocessing
 import os
 import re
+import string
 import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
 
-# Import kicad's netlist reader helper.
-# This is copied from the kicad install's plugins directory.
+try:
+  import resource
+except ImportError:
+  # Not available on Windows; peak memory isn't reported there.
+  resource = None
+
+# Import the Telesis encoding helpers, schematic reader, and BOM outputs that
+# live alongside this script.
 sys.dont_write_bytecode = True
-import kicad_netlist_reader
-
-# Routines to convert strings into various Telesis-safe output.
-# Character safety rules (discovered by trial and error):
-# ! and ' in strings will cause errors even if they're 'quoted'.
-# Non-ASCII characters will also cause errors.
-# Strings that include spaces, +, -, or . need to be 'quoted'.
-# Device names cannot include spaces, +, -, /, or .
-def format_text(t):
-  # Convert a string into Telesis-safe format. Unsupported characters are
-  # replaced with ?'s, and the string is quoted if necessary.
-  # FIXME: replace unsupported characters with an encoding instead, to avoid
-  #        having similar strings mapped to each other
-  if not t:
-    return ''
-  t = re.sub("[!']|[^ -~]", '?', t.replace('\u03BC', 'u'))
-  return f"'{t}'" if re.search('[^a-zA-Z0-9_/]', t) else t
-def format_net(t):
-  # Converts a string into one safe for a Telesis net name.
-  # Since nets in Allegro are case-insensitive, make them all uppercase to match
-  # Allegro's own output.
-  return format_text(t).upper()
-def format_dev(t):
-  # Converts a string into one safe for a Telesis device name.
-  # These are all lowercase and have a more restricted set of characters.
-  # FIXME: replace unsupported characters with an encoding instead
-  return re.sub('[^a-z0-9_-]', '_', t.lower())
-def format_pin(p):
-  # Generates a Telesis-compatible pin name from a pin node.
-  # Telesis requires all pin names to be unique, and doesn't have separate
-  # fields for pin number and pin name/function, so we combine them together to
-  # make a unique name that still describes its function if you check pin info.
-  # FIXME: replace unsupported characters with an encoding instead
-  t = '%s__%s' % (p.get('pin', 'name'), p.get('pin', 'num'))
-  return re.sub('[^A-Za-z0-9_+?/-]', '?', t)
+import bom
+import kicad_sch
+import telesis
+
+# Streaming netlist loader.
+# KiCad ships a kicad_netlist_reader helper that builds the entire XML document
+# as a tree of wrapper objects, which is slow and memory hungry on large boards.
+# Instead, we stream through the netlist with iterparse and keep only compact
+# records of the parts we actually use, discarding each XML element as soon as
+# it has been read. Lookups mimic the semantics of kicad_netlist_reader (first
+# non-empty match wins, component fields override library fields) so that the
+# output is unchanged.
+# The records use __slots__, and the names that repeat throughout a netlist
+# (refdes, pin numbers and names, net names, library names, and sheet paths) are
+# interned, so that each distinct name is only stored once. This keeps the
+# memory per net node down on large boards, and makes comparing and hashing
+# names (e.g., when grouping components) cheaper.
+
+intern = sys.intern
+
+class Pin:
+  # A pin of a library part.
+  __slots__ = ('num', 'name')
+
+  def __init__(self, num, name):
+    self.num = intern(num)
+    self.name = intern(name)
+
+class LibPart:
+  # A library part definition, shared by all components instantiating it.
+  __slots__ = ('lib', 'part', 'aliases', 'fields', 'field_index', 'footprints',
+               'pins', 'key')
+
+  def __init__(self, lib, part, aliases, fields, footprints, pins):
+    self.lib = intern(lib)
+    self.part = intern(part)
+    self.aliases = aliases
+    # Dict of field name to contents, in netlist order
+    self.fields = fields
+    # Case-insensitive index of the fields; see field_index
+    self.field_index = field_index(fields)
+    # List of footprint filters, or None if the libpart has none
+    self.footprints = footprints
+    # List of Pins, or None if the libpart has no pins section
+    self.pins = pins
+    # Identifies library parts with the same contents across netlists
+    self.key = (lib, part,
+                tuple(footprints) if footprints is not None else None,
+                tuple((p.num, p.name) for p in pins)
+                if pins is not None else None)
+
+  def get_field(self, name):
+    return self.fields.get(name, '')
+
+  def get_footprint(self):
+    return self.get_field('Footprint')
+
+# Component flags, as named by the properties of a comp in an XML netlist
+COMPONENT_FLAGS = frozenset(('dnp', 'exclude_from_bom', 'exclude_from_board'))
+
+class Component:
+  # A component instance in the schematic.
+  __slots__ = ('ref', 'value', 'footprint', 'fields', 'lib', 'part',
+               'sheetpath', 'flags', 'libpart')
+
+  def __init__(self, ref, value, footprint, fields, lib, part, sheetpath,
+               flags=frozenset()):
+    self.ref = intern(ref)
+    self.value = intern(value)
+    # The footprint specified on the instance; see get_footprint
+    self.footprint = intern(footprint)
+    # Dict of field name to contents, in netlist order
+    self.fields = fields
+    self.lib = intern(lib)
+    self.part = intern(part)
+    self.sheetpath = intern(sheetpath)
+    # Set of COMPONENT_FLAGS that are set
+    self.flags = frozenset(flags)
+    self.libpart = None
+
+  def get_field(self, name, library_too=True):
+    # Returns a field of the component, falling back to the library part.
+    field = self.fields.get(name, '')
+    if not field and library_too and self.libpart:
+      field = self.libpart.get_field(name)
+    return field
+
+  def get_footprint(self):
+    # Returns the footprint of the component, falling back to the library part.
+    if not self.footprint and self.libpart:
+      return self.libpart.get_footprint()
+    return self.footprint
+
+class Net:
+  # A net, with its nodes as a tuple of (refdes, pin number) tuples.
+  __slots__ = ('name', 'nodes')
+
+  def __init__(self, name, nodes):
+    self.name = intern(name)
+    self.nodes = tuple((intern(ref), intern(pin)) for ref, pin in nodes)
+
+class Netlist:
+  # The parts of a KiCad netlist needed for conversion.
+  __slots__ = ('source', 'date', 'components', 'libparts', 'nets', 'files')
+
+  def __init__(self):
+    self.source = ''
+    self.date = ''
+    # Paths of the files the netlist was read from, if known
+    self.files = []
+    self.components = []
+    self.libparts = []
+    self.nets = []
+
+  def group_components(self):
+    # Groups together components that have the same value, footprint, and
+    # refdes prefix, in the same way (and order) as kicad_netlist_reader:
+    # components within a group stay in netlist order (the reader sorts them,
+    # but throws the result away), and the groups are sorted by the refdes of
+    # their first component as a plain string (R10 before R2).
+    groups = {}
+    for c in self.components:
+      key = (c.value, c.get_footprint(), c.ref.rstrip(string.digits))
+      groups.setdefault(key, []).append(c)
+    return sorted(groups.values(), key=lambda grp: grp[0].ref)
+
+def group_field_index(grp):
+  # Builds a case-insensitive index of the fields of a component group, with
+  # the candidates for each name in the order KiCad's netlist reader searches
+  # them: the first component, then the library part, then the rest of the
+  # components (in group order).
+  libpart = grp[0].libpart
+  index = field_index(grp[0].fields)
+  if libpart:
+    for name, candidates in libpart.field_index.items():
+      index.setdefault(name, []).extend(candidates)
+  for c in grp[1:]:
+    field_index(c.fields, index)
+  return index
+
+def field_index(fields, index=None):
+  # Maps lowercased field names to lists of (name, contents) candidates in
+  # field order, skipping empty fields. Candidates are appended to index if
+  # given.
+  if index is None:
+    index = {}
+  for name, value in fields.items():
+    if value:
+      index.setdefault(name.lower(), []).append((name, value))
+  return index
+
+def lookup_field(index, field):
+  # Looks up a field in a field index. Like KiCad's netlist reader, the field
+  # name as given takes precedence, followed by its upper, lower, and
+  # capitalized forms; after that, any spelling matches. Within each of those,
+  # the first candidate wins. Returns None if the field doesn't exist.
+  candidates = index.get(field.lower())
+  if not candidates:
+    return None
+  for spelling in (field, field.upper(), field.lower(), field.capitalize()):
+    for name, value in candidates:
+      if name == spelling:
+        return value
+  return candidates[0][1]
+  return index
+
+def natural_sort_key(s):
+  # Sorts embedded numbers numerically, e.g. R2 before R10.
+  return [int(t) if t.isdigit() else t.lower() for t in re.split(r'(\d+)', s)]
+
+def _text(elem):
+  # Returns the text of an element. Whitespace-only text is treated as empty,
+  # just as KiCad's reader does.
+  t = elem.text
+  return t if t and not t.isspace() else ''
+
+def _find(elem, tag, attr=None):
+  # Returns the first non-empty text (or attribute, if specified) of an element
+  # or its descendants that match tag. This mirrors the depth-first search done
+  # by the get() method of kicad_netlist_reader elements.
+  for e in elem.iter(tag):
+    t = e.get(attr, '') if attr else _text(e)
+    if t:
+      return t
+  return ''
+
+def _read_fields(elem):
+  # Collects fields of a comp or libpart. The first non-empty instance of a
+  # duplicate field name wins.
+  fields = {}
+  for f in elem.iter('field'):
+    name = f.get('name', '')
+    if not fields.get(name):
+      fields[name] = _text(f)
+  return fields
+
+def _read_component(elem):
+  return Component(
+    ref=elem.get('ref', ''),
+    value=_find(elem, 'value'),
+    footprint=_find(elem, 'footprint'),
+    fields=_read_fields(elem),
+    lib=_find(elem, 'libsource', 'lib'),
+    part=_find(elem, 'libsource', 'part'),
+    sheetpath=_find(elem, 'sheetpath', 'names'),
+    flags={p.get('name') for p in elem.iter('property')} & COMPONENT_FLAGS)
+
+def _read_libpart(elem):
+  aliases = elem.find('aliases')
+  footprints = elem.find('footprints')
+  pins = elem.find('pins')
+  return LibPart(
+    lib=elem.get('lib', ''),
+    part=elem.get('part', ''),
+    aliases=[_text(a) for a in aliases] if aliases is not None else [],
+    fields=_read_fields(elem),
+    footprints=([_find(fp, 'fp') for fp in footprints.iter('fp')]
+                if footprints is not None else None),
+    pins=([Pin(p.get('num', ''), p.get('name', '')) for p in pins.iter('pin')]
+          if pins is not None else None))
+
+def _read_net(elem):
+  return Net(elem.get('name', ''), (
+    (n.get('ref', ''), n.get('pin', '')) for n in elem.iter('node')))
+
+def load_netlist(src, sheet_cache=None):
+  # Loads a KiCad XML netlist from a path or file object. Paths to .kicad_sch
+  # files are read as schematics instead; see load_schematic.
+  if isinstance(src, str) and src.endswith('.kicad_sch'):
+    return load_schematic(src, sheet_cache)
+  nl = Netlist()
+  if isinstance(src, str):
+    nl.files = [os.path.abspath(src)]
+  # Stack of currently-open elements, so that finished elements can be removed
+  # from their parents and freed.
+  stack = []
+  for event, elem in ET.iterparse(src, events=('start', 'end')):
+    if event == 'start':
+      stack.append(elem)
+      continue
+    stack.pop()
+    tag = elem.tag
+    if tag == 'comp':
+      nl.components.append(_read_component(elem))
+    elif tag == 'libpart':
+      nl.libparts.append(_read_libpart(elem))
+    elif tag == 'net':
+      nl.nets.append(_read_net(elem))
+    elif tag == 'design':
+      nl.source = _find(elem, 'source')
+      nl.date = _find(elem, 'date')
+    elif len(stack) != 1:
+      # Keep everything else until its top-level section is complete
+      continue
+    if stack:
+      stack[-1].remove(elem)
+  link_libparts(nl)
+  return nl
+
+def load_schematic(path, sheet_cache=None):
+  # Loads a netlist directly from the root sheet of a KiCad schematic, without
+  # exporting an XML netlist first. Sheets are read through sheet_cache (a
+  # kicad_sch.SheetCache), if given, so that unchanged sheets aren't parsed
+  # again.
+  sch = kicad_sch.Schematic(path, sheet_cache)
+  nl = Netlist()
+  nl.source = sch.source
+  nl.date = sch.date
+  nl.files = sch.files
+  nl.components = [Component(*c) for c in sch.components]
+  # Symbols without pins (such as logos) have no pins section in an XML netlist
+  nl.libparts = [LibPart(lib, part, [], fields, footprints,
+                         [Pin(num, name) for num, name in pins] or None)
+                 for lib, part, fields, footprints, pins in sch.libparts]
+  nl.nets = [Net(name, nodes) for name, nodes in sch.nets]
+  link_libparts(nl)
+  return nl
+
+def link_libparts(nl):
+  # Link components to their library parts. The first libpart that matches by
+  # name or alias wins.
+  libparts = {}
+  for p in nl.libparts:
+    for name in [p.part] + p.aliases:
+      libparts.setdefault((p.lib, name), p)
+  for c in nl.components:
+    c.libpart = libparts.get((c.lib, c.part))
+    if not c.libpart:
+      print('missing libpart for ref:', c.ref, c.part, c.lib)
 
 def pin_sort_key(p):
   # Provide a sorting key for a pin so that the pin order within a function
   # group is consistent. Consistency is important when matching regexes in
   # pinswap definitions.
-  name = p.get('pin', 'name')
-  if name and name != '~':
-    return name
-  return p.get('pin', 'num')
-
-def get_group_field(nl, grp, fields, sanitize=True):
-  # Look up a field for a component group, which may have mismatched case, or
-  # the component group may not have the field defined and instead the library
-  # entry has to be searched.  Returns None if no fields exist.
-  # nl: the netlist
-  # grp: the component group to query
+  if p.name and p.name != '~':
+    return p.name
+  return p.num
+
+def get_group_field(enc, index, fields, sanitize=True):
+  # Look up a field for a component group. Field names are case-insensitive
+  # (see lookup_field), and if the component group doesn't have the field
+  # defined, the library entry's field is used instead. Returns None if no
+  # fields exist.
+  # enc: the Telesis encoder
+  # index: the group's field index, from group_field_index
   # fields: one or more (equivalent) fields to query, in the order specified.
   #         first field that exists is returned.
   # sanitize: if true (default), will format/escape the field for Telesis output
   if isinstance(fields, str):
     fields = (fields,)
   for field in fields:
-    # FIXME: redo this logic to do a case-insensitive search of fields rather
-    #        than guessing some common alternative forms.
-    field = (nl.getGroupField(grp, field)
-          or nl.getGroupField(grp, field.upper())
-          or nl.getGroupField(grp, field.lower())
-          or nl.getGroupField(grp, field.capitalize()))
+    field = lookup_field(index, field)
     if field:
-      return format_text(field) if sanitize else field
+      return enc.text(field) if sanitize else field
   return None
 
-def find_group_functions(group):
-  # Searches a component group (and associated library) for function/pinswap
-  # definitions and returns a list of all the names of functions in alphabetical
-  # order. Component definitions will override library ones.
-  field_names = set()
-  for c in group:
-    field_names.update((f.lower() for f in c.getFieldNames()))
-  libpart = group[0].getLibPart()
-  if libpart:
-    field_names.update((f.lower() for f in libpart.getFieldNames()))
-  functions = []
-  for f in field_names:
-    if f.startswith('func_'):
-      functions.append(f[5:])
-  return sorted(functions)
-
-def format_function(name, pin_groups, swap_indices=None):
-  # Generates the definition of a function in Telesis format, which consists of
-  # multiple declarations (PINORDER, PINSWAP, and FUNCTIONs).
-  is_multi = len(pin_groups) > 1
-  name = name.upper()
-  # Only one pin name can be defined across all instances of a function in a
-  # part. We don't want to drop the details of the pin name and number, so
-  # concatenate all the pin names across groups of the same function.
-  # It's ugly, but it's the only way to get these details into Allegro.
-  pinnames = list(format_pin(p) for p in pin_groups[0])
-  for group in pin_groups[1:]:
-    for i in range(len(pinnames)):
-      pinnames[i] = '%s____%s' % (pinnames[i], format_pin(group[i]))
-  # PINORDER defines all the pin names that go into a function.
-  out = format_list('PINORDER %s ' % name, pinnames)
-  # PINSWAP specifies which pin names within the function defined above are
-  # arbitrarily swappable (e.g., a bunch of swappable GPIOs within a bank of
-  # GPIOs that are in turn swappable with another equivalent bank).
-  if swap_indices:
-    out += format_list('PINSWAP %s ' % name,
-                       sorted(pinnames[i] for i in swap_indices))
-  # FUNCTION defines the mapping of each pin name to the footprint's pin
-  # numbers, for each swappable instance of the function in the part.
-  # These numbers are specified in the same order as the names in PINORDER.
-  # This is why we only get one pin name across multiple instances of a
-  # function, and why we have to make the pin name super ugly to keep details.
-  for i, group in enumerate(pin_groups):
-    groupname = name + str(i+1)*is_multi
-    out += format_list('FUNCTION %s %s ' % (groupname, name), (
-                       p.get('pin', 'num') for p in group))
-  return out
+def find_group_functions(index):
+  # Searches a component group's field index (which includes the associated
+  # library) for function/pinswap definitions and returns a list of all the
+  # names of functions in alphabetical order.
+  return sorted(f[5:] for f in index if f.startswith('func_'))
 
-def format_list(start, items):
-  # Formats a list of items into a Telesis-compatible list. Prepends a prefix.
-  # Lists are whitespace-separated and can be split across lines using comma as
-  # a line continuation character. Long lines need to be split.
-  # NOTE: instead of making things pretty and wrapping at Allegro's arbitrary
-  # maximum line length (78 characters in the documentation but 1024 characters
-  # based on testing), we instead just use line continuation characters and
-  # newlines for every element in the list. This also makes diffing much more
-  # useful, so it's not only due to laziness.
-  return '%s%s\n' % (start, ',\n\t'.join(items))
+class CacheStats:
+  # Counts cache hits and misses, and the regexes evaluated on misses.
+  def __init__(self):
+    self.hits = 0
+    self.misses = 0
+    self.regexes = 0
+
+class LibPartCache:
+  # Caches data resolved from library parts: pin lists indexed by name, the
+  # groups of pins of func_* definitions, and footprints.
+  # Library parts are identified by their contents (LibPart.key), so a cache
+  # can be shared between netlists, e.g. when converting several projects that
+  # use the same library symbols. Within a netlist, results are shared between
+  # component groups with the same library part.
+  # When resolving functions, each regex is only evaluated once per distinct pin
+  # name, and claimed pins are tracked in a set rather than deleted from a list.
+  def __init__(self):
+    # Maps LibPart.key to a dict of pin name to the indices of pins with that
+    # name
+    self._names = {}
+    self._functions = {}
+    self._footprints = {}
+    self._pin_collisions = {}
+    self.stats = CacheStats()
+    self._lock = threading.Lock()
+
+  def _lookup(self, cache, key, compute, stats):
+    # Looks up key in cache, computing it if missing, and counts the hit or miss
+    # in the cache's stats as well as stats, if given.
+    result = cache.get(key)
+    hit = result is not None
+    if not hit:
+      result = cache[key] = compute()
+    with self._lock:
+      for s in (self.stats, stats) if stats else (self.stats,):
+        if hit:
+          s.hits += 1
+        else:
+          s.misses += 1
+    return result
 
+  def pin_collisions(self, libpart, enc, stats=None):
+    # Returns the Telesis pin names of a library part that more than one pin
+    # name and number convert to, as a list of (pin name, [(name, number)])
+    # tuples. Pin names are compared case-insensitively, like net names.
+    def compute():
+      index = {}
+      for p in libpart.pins:
+        originals = index.setdefault(enc.pin(p.name, p.num).upper(), [])
+        if (p.name, p.num) not in originals:
+          originals.append((p.name, p.num))
+      return [(name, originals) for name, originals in index.items()
+              if len(originals) > 1]
+    return self._lookup(self._pin_collisions, (libpart.key, enc.reversible),
+                        compute, stats)
 
-# Process command line arguments. KiCad seems to specify .xml for output_dir
-# regardless of what you did in the file chooser, so handle that case as well.
-if len(sys.argv) < 3:
-  sys.stderr.write('Usage: %s netlist.xml output_dir\n' % sys.argv[0])
-  sys.exit(2)
-src = sys.argv[1]
-if not os.path.isfile(src):
-  sys.stderr.write('KiCAD netlist not found: %s\n' % src)
-  sys.exit(1)
-if os.path.isdir(sys.argv[2]):
-  dest = os.path.join(sys.argv[2], 'netlist.txt')
-elif '.' in os.path.basename(sys.argv[2]):
-  dest = '%s.txt' % sys.argv[2].rpartition('.')[0]
-else:
-  dest = '%s.txt' % sys.argv[2]
-# Allegro will search many places for device definition files that are
-# referenced in the netlist text file. This is configurable (DEVPATH in
-# Allegro's env), but the default configuration includes the same directory as
-# the netlist itself, which is the most sensible location for our output.
-devdir = os.path.join(os.path.dirname(dest), 'devices')
-
-# Load the netlist
-nl = kicad_netlist_reader.netlist(src)
-
-# Create the devices directory
-os.makedirs(devdir, exist_ok=True)
-
-# Write the netlist file
-f = open(dest, 'w')
-f.write('(Source: %s)\n' % nl.getSource())
-f.write('(Date: %s)\n' % nl.getDate())
-
-# $ SECTION markers are stateful and sometimes affect each other (so
-# $A_PROPERTIES will relate to whichever $PACKAGES/$NETS was specified last).
-
-# Start with package definitions, which we create from component groups.
-f.write('$PACKAGES\n')
-component_groups = nl.groupComponents()
-for grp in component_groups:
-  # FIXME: what should we do about parts with exclude_from_board set?
-  #        Most of the time these will be BOM items that have no pins, so the
-  #        following no-pin check will do the right thing. But if they have
-  #        pins, do we need to exclude the item *and* remove them from all nets?
-  #        We would need to remove subsequently-empty nets as well?
-  libpart = grp[0].getLibPart()
-  # Don't output components that don't have pins (such as BOM items), as the
-  # Telesis format does not support pinless parts.
-  if not libpart.element.getChild('pins'):
-    continue
-  # Generate the device type, which will be the filename for the device file.
-  # This name needs to be unique not just for the footprint but also for the
-  # properties (at least height, alt footprints, and functions, if not also
-  # value and tolerance), so combine the footprint name with the value to get
-  # something unique. If the footprint field isn't defined (which it probably
-  # isn't in Allegro-centric designs), just use the part name.
-  # TODO: It may be possible to not write value and tolerance into the device
-  #       file (since it's overridden in the netlist's component list), and then
-  #       combine all the parts that have the same properties into a single
-  #       device file, named something like footprint_i where i indexes into the
-  #       (consistently sorted) sets of properties. This would significantly
-  #       reduce the number of device files generated for resistors and caps,
-  #       and not create too many additional files as the design progresses
-  #       (hashing the properties to generate the name would create a lot of
-  #       leftover files in version control as parts change, so don't do that).
-  # FIXME: if footprint isn't specified and value is ~ for some reason, this
-  #        will create a "_" file that may collide with other similar mixups!
-  #        Instead of using the part value, maybe the part name in the library
-  #        would be a better choice, or at least a good fallback?
-  device_type = format_dev(('%s_%s' % (
-    grp[0].getValue(), grp[0].getFootprint())).rstrip('_'))
-  # Telesis format allows for specifying value and tolerance, which is helpful
-  # when looking at designs. The exact field name used to store the value
-  # (resistance, capacitance) depends on the library implementation.
-  # TODO: this list probably needs to be customizable, or perhaps include a more
-  #       exhaustive list of reasonable options more options (val, res, cap, L,
-  #       etc; whatever it seems people are doing).
-  value = get_group_field(nl, grp, ('Spice_Model', 'VALUE'))
-  tol = get_group_field(nl, grp, ('TOLERANCE', 'TOL'))
-  # Instantiate the list of all the parts with these same specs.
-  f.write(format_list('!%s!%s!%s;' % (device_type, value, tol),
-                      (c.getRef() for c in grp)))
-  # Write out the corresponding device file
-  with open(os.path.join(devdir, '%s.txt' % device_type), 'w') as d:
-    # We need to pick a reasonable footprint as the default Allegro footprint.
-    # By default we'll use the contents of the Footprint field, with the leading
-    # library name stripped out. This is unlikely to be defined in
-    # Allegro-centric symbol libraries, though, in which case we use the
-    # contents of the footprint filters list as described above.
-    # If nothing is defined, give up and just throw in the device_type string,
-    # which is unlikely to match anything unless you have a very strange
-    # footprint library.
-    # Use the instance's footprint in case it overrides the library's
-    footprints = libpart.element.getChild('footprints')
-    default_footprint = (footprints.getChildren('fp')[0].get('fp')
-                         if footprints else device_type)
-    # Remove the library name from the footprint, if present
-    footprint = (grp[0].getFootprint() or default_footprint).rpartition(':')[2]
-    # Write out the chosen default footprint. Additional footprints are written
-    # to the ALT_SYMBOLS property.
-    d.write("PACKAGE '%s'\n" % format_dev(footprint))
-    # Valid classes are IC, IO, and DISCRETE. This mainly seems to enable
-    # filtering in Quickplace, and BGA Text Out (requires IO) when using APD.
-    # It also seems to affect default pin-swap options when they're not
-    # specified (we fully-specify it so this shouldn't matter).
-    # TODO: heuristically specify IO or DISCRETE, if it doesn't have unexpected
-    #       consequences. IO could be selected when PINSWAP covers all pins.
-    #       DISCRETE could be selected for two-terminal parts.
-    d.write('CLASS IC\n')
-    # Write out library part info
-    pins = libpart.element.getChild('pins').getChildren('pin')
-    d.write('PINCOUNT %u\n' % len(pins))
-    # Collect functions, if specified
-    for func in find_group_functions(grp):
+  def pin_names(self, libpart):
+    names = self._names.get(libpart.key)
+    if names is None:
+      names = {}
+      for i, p in enumerate(libpart.pins):
+        names.setdefault(p.name, []).append(i)
+      self._names[libpart.key] = names
+    return names
+
+  def footprints(self, libpart, enc, stats=None):
+    # Returns the default footprint filter of a library part and the formatted
+    # list of all its footprint filters (for ALT_SYMBOLS), or (None, None) if
+    # the library part has no footprint filters.
+    def compute():
+      if libpart.footprints is None:
+        return None, None
+      return libpart.footprints[0], ','.join(
+        enc.dev(fp.rpartition(':')[2]) for fp in libpart.footprints)
+    return self._lookup(self._footprints, (libpart.key, enc.reversible),
+                        compute, stats)
+
+  def resolve(self, libpart, specs, stats=None):
+    # Resolves a list of (function name, func_* contents) tuples, which must be
+    # in alphabetical order. Returns a tuple of:
+    #   a list of (function name, groups of pins, swap indices) tuples
+    #   the remaining pins, which belong to the main function
+    #   a list of warnings about invalid definitions
+    return self._lookup(self._functions, (libpart.key, tuple(specs)),
+                        lambda: self._resolve(libpart, specs, stats), stats)
+
+  def _resolve(self, libpart, specs, stats):
+    pins = libpart.pins
+    names = self.pin_names(libpart)
+    # The set of pins already claimed by a function, and a sort order for the
+    # remaining pins. Pins that are added back to the main function after a
+    # broken definition go to the end of the order.
+    claimed = set()
+    order = list(range(len(pins)))
+    next_order = len(pins)
+    functions = []
+    warnings = []
+    # Number of regex evaluations against pin names
+    evaluations = 0
+    for func, spec in specs:
       # Split out each group of pins
-      group_sets = get_group_field(nl, grp, 'func_' + func, sanitize=False).split(';')
+      group_sets = spec.split(';')
       # Set aside swap indices, if provided (first group after an empty one)
-      swap_indices = set()
       swap_indices_text = ''
       if '' in group_sets:
         end_of_group_list = group_sets.index('')
@@ -342,40 +543,49 @@ for grp in component_groups:
         # TODO: Maybe output a warning if we're dropping additional fields, in
         #       case the definition accidentally has too many semicolons?
         del group_sets[end_of_group_list:]
-      # Collect groups (a list of lists of pins)
+      # Each group is made up of comma-separated regexes. Match all of them
+      # against the pin names in one pass: a pin belongs to the first regex that
+      # matches it, across all groups of the function.
+      regexes = []
+      for g, group_res in enumerate(group_sets):
+        for group_re in group_res.split(','):
+          if group_re:
+            regex = re.compile(group_re, re.IGNORECASE)
+            # KiCad takes pin names that are ~ and writes them out to the
+            # netlist as empty, so handle that case.
+            regexes.append((g, regex, bool(regex.match('~')), []))
+      for name, indices in names.items():
+        for g, regex, include_empty, matches in regexes:
+          evaluations += 1
+          if regex.match(name) or include_empty and not name:
+            matches.extend(i for i in indices if i not in claimed)
+            break
+      # Collect groups (a list of lists of pin indices)
       groups = []
-      for group_res in group_sets:
+      for g, group_res in enumerate(group_sets):
         group_pins = []
         groups.append(group_pins)
-        # Each group is made up of comma-separated regexes
-        for group_re in group_res.split(','):
-          if not group_re:
-            continue
-          regex_matches = set()
-          regex = re.compile(group_re, re.IGNORECASE)
-          # KiCad takes pin names that are ~ and writes them out to the netlist
-          # as empty, so handle that case.
-          include_empty = bool(regex.match('~'))
-          # Check all the pins for matches; iterate in reverse so we can remove
-          # matches from the list.
-          for i in range(len(pins)-1, -1, -1):
-            pinname = pins[i].get('pin', 'name')
-            if regex.match(pinname) or include_empty and not pinname:
-              regex_matches.add(pins[i])
-              del pins[i]
+        for _, _, _, matches in (r for r in regexes if r[0] == g):
           # Matches within a regex are sorted, but order between multiple
-          # regexes are maintained.
-          group_pins.extend(sorted(regex_matches, key=pin_sort_key))
+          # regexes are maintained. Pins with the same name stay in order, so
+          # that the output doesn't change from run to run.
+          claimed.update(matches)
+          group_pins.extend(sorted(
+            matches, key=lambda i: (pin_sort_key(pins[i]), order[i])))
         # Check that the pin count is the same
         if len(group_pins) != len(groups[0]):
           # Function is invalid; output a warning and drop the function.
-          print(f'group length mismatch in function {func}')
-          print(f'pattern {group_res} does not expand to the same number of pins')
+          warnings.append(f'group length mismatch in function {func}')
+          warnings.append(
+            f'pattern {group_res} does not expand to the same number of pins')
           # Add pins back to the default list so at least netlist is complete.
           # This may affect subsequent function definitions if regexes
           # overlap...but that's explicitly disallowed so it's fine.
           for group in groups:
-            pins.extend(group)
+            for i in group:
+              claimed.discard(i)
+              order[i] = next_order
+              next_order += 1
           groups = []
           break
       # Skip empty/broken groups
@@ -383,6 +593,7 @@ for grp in component_groups:
         # FIXME: spit out a warning?
         continue
       # Process swap indices range expansion
+      swap_indices = set()
       if swap_indices_text == '*':
         swap_indices.update(range(len(groups[0])))
       elif swap_indices_text:
@@ -392,69 +603,699 @@ for grp in component_groups:
           swap_indices.update(range(
             min(int(r[0])-1, len(groups[0])),
             min(int(r[1]), len(groups[0]))))
-      # Write out the collected function data
-      d.write(format_function(func, groups, swap_indices))
+      functions.append((func, [[pins[i] for i in group] for group in groups],
+                        swap_indices))
     # Any pins left over belong to the main group.
-    if pins:
-      d.write(format_function('main', [pins]))
-    # Write out properties; there are only a few that are supported.
-    if value:
-      d.write('PACKAGEPROP VALUE %s\n' % value)
-    if tol:
-      d.write('PACKAGEPROP TOL %s\n' % tol)
-    # Only write out ALT_SYMBOLS if the footprint wasn't overridden.
-    # This is to avoid mixups and stale footprints if e.g., the designer
-    # overrides an 0402 part with an 0603, or overrides a generic part with a
-    # special footprint for some purpose.
-    if footprints and footprint in (libpart.getFootprint(), default_footprint):
-      # Strip any library names out of the footprint filters.
-      # TODO: implement glob support by searching PSMPATH?
-      #       this would require parsing the Allegro environment files (tcl
-      #       scripts) and may not be realistic to do. Alternatively, could
-      #       require the designer to redundantly specify the psm directory list
-      #       somewhere, ideally in the library.
-      d.write("PACKAGEPROP ALT_SYMBOLS '(%s)'\n" % ','.join(
-        format_dev(fp.get('fp').rpartition(':')[2])
-        for fp in footprints.getChildren('fp')))
-    # Include any remaining Allegro-recognizable properties
-    # HEIGHT will set the default box height in the 3D view, if the footprint
-    # doesn't have a PACKAGE_HEIGHT_MAX property on a PLACE_BOUND_* shape
-    # TODO: either customize the field mapping to PART_NUMBER and HEIGHT, or
-    #       include a more exhaustive list of reasonable options
-    # TODO: it would be nice if PART_NUMBER could be prepended with the
-    #       manufacturer, if specified
-    for prop in (('PART_NUMBER', 'mpn', 'mfr_pn'), ('HEIGHT',)):
-      data = get_group_field(nl, grp, prop)
-      if data:
-        d.write("PACKAGEPROP %s %s\n" % (prop[0], data))
-    # Done with device file
-    d.write('END\n')
-
-# Write out nets
-f.write('$NETS\n')
-for net in nl.nets:
-  netname = format_net(net.get('net', 'name'))
-  # Each net has a list of refdes.pinnum
-  f.write(format_list('%s ; ' % netname, (
-      '%s.%s' % (n.get('node', 'ref'), n.get('node', 'pin'))
-      for n in net.getChildren('node'))))
-
-# Write out package properties. NOTE: Allegro doesn't recognize much...
-f.write('$PACKAGES\n$A_PROPERTIES\n')
-rooms = {}
-for comp in nl.components:
-  # Exclude parts whose definitions were previously excluded
-  if not comp.getLibPart().element.getChild('pins'):
-    continue
-  # Use the sheet path as ROOM, if not otherwise specified.
-  # This is the only way to enable placing by page, since the Telesis format
-  # doesn't enable specifying page numbers in addition to ROOM definitions.
-  room = format_text(comp.getField('ROOM')
-                     or comp.element.get('sheetpath', 'names'))
-  if room:
-    rooms.setdefault(room, []).append(comp.getRef())
-for room, refs in sorted(rooms.items(), key=lambda s: s[0].strip("'")):
-  f.write(format_list('ROOM %s ; ' % room, refs))
-
-# Done with the netlist
-f.close()
+    main = sorted((i for i in range(len(pins)) if i not in claimed),
+                  key=order.__getitem__)
+    with self._lock:
+      for s in (self.stats, stats) if stats else (self.stats,):
+        s.regexes += evaluations
+    return functions, [pins[i] for i in main], warnings
+
+def format_function(enc, name, pin_groups, swap_indices=None):
+  # Generates the definition of a function in Telesis format, which consists of
+  # multiple declarations (PINORDER, PINSWAP, and FUNCTIONs).
+  is_multi = len(pin_groups) > 1
+  name = name.upper()
+  # Only one pin name can be defined across all instances of a function in a
+  # part. We don't want to drop the details of the pin name and number, so
+  # concatenate all the pin names across groups of the same function.
+  # It's ugly, but it's the only way to get these details into Allegro.
+  pinnames = list(enc.pin(p.name, p.num) for p in pin_groups[0])
+  for group in pin_groups[1:]:
+    for i in range(len(pinnames)):
+      pinnames[i] = '%s____%s' % (pinnames[i],
+                                  enc.pin(group[i].name, group[i].num))
+  # PINORDER defines all the pin names that go into a function.
+  out = format_list('PINORDER %s ' % name, pinnames)
+  # PINSWAP specifies which pin names within the function defined above are
+  # arbitrarily swappable (e.g., a bunch of swappable GPIOs within a bank of
+  # GPIOs that are in turn swappable with another equivalent bank).
+  if swap_indices:
+    out += format_list('PINSWAP %s ' % name,
+                       sorted(pinnames[i] for i in swap_indices))
+  # FUNCTION defines the mapping of each pin name to the footprint's pin
+  # numbers, for each swappable instance of the function in the part.
+  # These numbers are specified in the same order as the names in PINORDER.
+  # This is why we only get one pin name across multiple instances of a
+  # function, and why we have to make the pin name super ugly to keep details.
+  for i, group in enumerate(pin_groups):
+    groupname = name + str(i+1)*is_multi
+    out += format_list('FUNCTION %s %s ' % (groupname, name), (
+                       p.num for p in group))
+  return out
+
+def write_file(path, text, incremental=False):
+  # Writes text out to path. In incremental mode, the file is left untouched if
+  # it already has the same contents, so that its timestamp doesn't change and
+  # Allegro doesn't see it as modified. Otherwise, it is written to a temporary
+  # file first and then renamed over the original, so that an interrupted run
+  # never leaves a partially-written file behind.
+  # Returns 'added', 'changed', or 'unchanged' ('changed' if not incremental).
+  if not incremental:
+    with open(path, 'w') as f:
+      f.write(text)
+    return 'changed'
+  status = 'added'
+  if os.path.isfile(path):
+    status = 'changed'
+    with open(path) as f:
+      if f.read() == text:
+        return 'unchanged'
+  with open(path + '.tmp', 'w') as f:
+    f.write(text)
+  os.replace(path + '.tmp', path)
+  return status
+
+def format_list(start, items):
+  # Formats a list of items into a Telesis-compatible list. Prepends a prefix.
+  # Lists are whitespace-separated and can be split across lines using comma as
+  # a line continuation character. Long lines need to be split.
+  # NOTE: instead of making things pretty and wrapping at Allegro's arbitrary
+  # maximum line length (78 characters in the documentation but 1024 characters
+  # based on testing), we instead just use line continuation characters and
+  # newlines for every element in the list. This also makes diffing much more
+  # useful, so it's not only due to laziness.
+  return '%s%s\n' % (start, ',\n\t'.join(items))
+
+
+class Options:
+  # Conversion options. These correspond to the command line flags.
+  def __init__(self, escape=False, consolidate=False, jobs=1,
+               incremental=False, stats=False):
+    # Escape unsupported characters with a reversible encoding
+    self.escape = escape
+    # Share device files between parts that only differ in value and tolerance
+    self.consolidate = consolidate
+    # Number of workers generating device files in parallel
+    self.jobs = jobs
+    # Only write out files whose contents changed
+    self.incremental = incremental
+    # Collect timings and counts of the conversion into Conversion.stats
+    self.stats = stats
+
+class Stats:
+  # Timings and counts of a conversion, for finding out where time is spent.
+  def __init__(self):
+    # Dict of phase name to seconds, in the order the phases ran
+    self.phases = {}
+    # Dict of counted item to count
+    self.counts = {}
+    # List of (seconds, device_type, refs) tuples, one per component group
+    self.groups = []
+    # Peak resident memory of the process in bytes, if known
+    self.peak_memory = None
+
+  @contextlib.contextmanager
+  def phase(self, name):
+    # Times a phase of the conversion. Phases that run more than once add up.
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.phases[name] = (self.phases.get(name, 0.0) +
+                           time.perf_counter() - start)
+
+  def measure_memory(self):
+    # Records the peak resident memory of the process so far.
+    if resource:
+      rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+      # Linux reports KiB, macOS reports bytes
+      self.peak_memory = rss if sys.platform == 'darwin' else rss * 1024
+
+  def slowest_groups(self, top):
+    return sorted(self.groups, key=lambda g: -g[0])[:top]
+
+  def to_dict(self, top=10):
+    return {
+      'phases': self.phases,
+      'total_seconds': sum(self.phases.values()),
+      'peak_memory_bytes': self.peak_memory,
+      'counts': self.counts,
+      'slowest_groups': [{'seconds': seconds, 'device_type': device_type,
+                          'refs': refs}
+                         for seconds, device_type, refs
+                         in self.slowest_groups(top)],
+    }
+
+  def format_text(self, top=10):
+    out = ['Phases:\n']
+    for name, seconds in self.phases.items():
+      out.append('  %-10s %9.4f s\n' % (name, seconds))
+    out.append('  %-10s %9.4f s\n' % ('total', sum(self.phases.values())))
+    if self.peak_memory is not None:
+      out.append('Peak memory: %.1f MiB\n' % (self.peak_memory / (1 << 20)))
+    out.append('Counts:\n')
+    for name, count in self.counts.items():
+      out.append('  %-20s %u\n' % (name, count))
+    if self.groups:
+      out.append('Slowest component groups:\n')
+      for seconds, device_type, refs in self.slowest_groups(top):
+        out.append('  %9.4f s  %s (%s%s)\n' % (
+          seconds, device_type, ','.join(refs[:5]),
+          ',...' if len(refs) > 5 else ''))
+    return ''.join(out)
+
+def _phase(stats, name):
+  # Times a phase if stats are being collected.
+  return stats.phase(name) if stats else contextlib.nullcontext()
+
+class Conversion:
+  # The result of converting a netlist: everything that goes into the netlist
+  # and device files.
+  def __init__(self, source, date):
+    self.source = source
+    self.date = date
+    # List of (device_type, value, tol, refs) tuples
+    self.packages = []
+    # Dict of device_type to the contents of its device file
+    self.devices = {}
+    # List of (net name, nodes) tuples, with nodes as refdes.pinnum strings
+    self.nets = []
+    # List of (room, refs) tuples, sorted by room
+    self.rooms = []
+    # Warnings about invalid definitions, in component group order
+    self.warnings = []
+    # Set by write(): 'added', 'changed', or 'unchanged' for the netlist file,
+    # and a dict of device_type to the same for each device file
+    self.netlist_status = None
+    self.device_status = {}
+    # Set by allegro_netlist.convert(): list of (sink, status) tuples, with the
+    # same statuses as above
+    self.sink_status = []
+    # Stats of the conversion, if Options.stats is set
+    self.stats = None
+    # Names that distinct nets, device files, or pins were converted into, as
+    # a list of (kind, part, name, originals) tuples, where kind is 'net',
+    # 'device', or 'pin', and part is the library part of colliding pins.
+    # originals are (name, pin number) tuples for pins, and (name, refs) tuples
+    # of the conflicting component groups for device files.
+    self.collisions = []
+
+  def collision_report(self):
+    # Returns a description of each name collision, one per line.
+    out = []
+    for kind, part, name, originals in self.collisions:
+      where = ' in part %s' % part if part else ''
+      if kind == 'pin':
+        originals = ["'%s' (pin %s)" % p for p in originals]
+      elif kind == 'device':
+        originals = ["'%s' (%s)" % (o, ','.join(refs)) for o, refs in originals]
+      else:
+        originals = ["'%s'" % o for o in originals]
+      out.append('%s name collision%s: %s <- %s\n' % (
+        kind, where, name, ', '.join(originals)))
+    return ''.join(out)
+
+  def netlist(self):
+    # Returns the contents of the Telesis netlist file.
+    # $ SECTION markers are stateful and sometimes affect each other (so
+    # $A_PROPERTIES will relate to whichever $PACKAGES/$NETS was specified
+    # last).
+    return ''.join(('(Source: %s)\n' % self.source, '(Date: %s)\n' % self.date,
+                    self.packages_section(), self.nets_section(),
+                    self.rooms_section()))
+
+  def packages_section(self):
+    # Package definitions instantiate the list of all the parts with the same
+    # specs.
+    out = ['$PACKAGES\n']
+    for device_type, value, tol, refs in self.packages:
+      out.append(format_list('!%s!%s!%s;' % (device_type, value, tol), refs))
+    return ''.join(out)
+
+  def nets_section(self):
+    # Each net has a list of refdes.pinnum
+    out = ['$NETS\n']
+    for netname, nodes in self.nets:
+      out.append(format_list('%s ; ' % netname, nodes))
+    return ''.join(out)
+
+  def rooms_section(self):
+    # Package properties. NOTE: Allegro doesn't recognize much...
+    out = ['$PACKAGES\n$A_PROPERTIES\n']
+    for room, refs in self.rooms:
+      out.append(format_list('ROOM %s ; ' % room, refs))
+    return ''.join(out)
+
+  def write(self, output, incremental=False):
+    # Writes out the netlist and device files. output is an output directory or
+    # netlist file name, as on the command line; see output_paths.
+    dest, devdir = output_paths(output)
+    os.makedirs(devdir, exist_ok=True)
+    self.device_status = {}
+    for device_type, text in self.devices.items():
+      self.device_status[device_type] = write_file(
+        os.path.join(devdir, '%s.txt' % device_type), text, incremental)
+    self.netlist_status = write_file(dest, self.netlist(), incremental)
+
+# State shared with forked worker processes; see Converter.generate_packages.
+_worker_state = None
+
+def _generate_package_at(i):
+  # Generates the package of a component group by index. Worker processes
+  # inherit the converter and component groups, so only the index needs to be
+  # sent to them.
+  converter, component_groups = _worker_state
+  return converter.timed_package(component_groups[i])
+
+class Converter:
+  # Converts netlists into Telesis format. The encoder and pin resolver caches
+  # are kept across conversions, so a converter can be reused to convert many
+  # netlists (or the same one repeatedly) in a single process.
+  def __init__(self, options=None, libpart_cache=None):
+    self.options = options or Options()
+    # Names and text are converted into Telesis-safe strings by the encoder.
+    self.enc = telesis.Encoder(reversible=self.options.escape)
+    # Library part data, such as function/pinswap definitions, is resolved
+    # through a cache that may be shared with other converters.
+    self.libpart_cache = libpart_cache or LibPartCache()
+    # Libpart cache hits and misses of this converter's conversions. These
+    # aren't counted when generating device files in worker processes.
+    self.cache_stats = CacheStats()
+
+  def convert(self, nl, stats=None):
+    # Converts a loaded Netlist, returning a Conversion. The conversion's stats
+    # are collected into stats if given, or into a new Stats if Options.stats
+    # is set.
+    conv = Conversion(nl.source, nl.date)
+    conv.stats = stats = stats or (Stats() if self.options.stats else None)
+    if stats:
+      cache_stats = vars(self.cache_stats).copy()
+    with _phase(stats, 'grouping'):
+      groups = nl.group_components()
+    with _phase(stats, 'devices'):
+      self.collect_packages(conv, groups)
+    with _phase(stats, 'nets'):
+      self.collect_nets(conv, nl)
+    with _phase(stats, 'rooms'):
+      self.collect_rooms(conv, nl)
+    if stats:
+      stats.counts.update(
+        components=len(nl.components), groups=len(groups),
+        packages=len(conv.packages), device_files=len(conv.devices),
+        nets=len(conv.nets), pins=sum(len(nodes) for _, nodes in conv.nets),
+        regex_evaluations=self.cache_stats.regexes - cache_stats['regexes'],
+        libpart_cache_hits=self.cache_stats.hits - cache_stats['hits'],
+        libpart_cache_misses=self.cache_stats.misses - cache_stats['misses'])
+      stats.measure_memory()
+    return conv
+
+  def collect_packages(self, conv, component_groups):
+    # Adds the packages and device files of the component groups to a
+    # Conversion.
+    # List of (device_type, value, tol, refs, footprint, device file, device
+    # name before conversion) tuples
+    packages = []
+    for grp, (seconds, result) in zip(component_groups,
+                                      self.generate_packages(component_groups)):
+      if conv.stats:
+        conv.stats.groups.append((seconds, result[0] if result else '',
+                                  [c.ref for c in grp]))
+      if result:
+        *package, warnings = result
+        conv.warnings.extend(warnings)
+        packages.append(tuple(package) + (self.device_name(grp),))
+        libpart = grp[0].libpart
+        for name, originals in self.libpart_cache.pin_collisions(
+            libpart, self.enc, self.cache_stats):
+          collision = ('pin', '%s:%s' % (libpart.lib, libpart.part), name,
+                       originals)
+          if collision not in conv.collisions:
+            conv.collisions.append(collision)
+    # Name the consolidated device files. Device files are grouped by footprint
+    # and indexed in order of their (sorted) contents.
+    if self.options.consolidate:
+      variants = {}
+      for _, _, _, _, footprint, device, _ in packages:
+        variants.setdefault(footprint, set()).add(device)
+      names = {}
+      for footprint, devices_for_footprint in variants.items():
+        for i, device in enumerate(sorted(devices_for_footprint), 1):
+          names[device] = '%s_%u' % (footprint, i)
+      packages = [(names[p[5]],) + p[1:] for p in packages]
+    # Groups can be converted into the same device type, e.g. when their values
+    # or footprints only differ by case, or when they only differ by refdes
+    # prefix or fields. That's fine as long as they'd write out the same device
+    # file, but otherwise one would overwrite the other.
+    # Dict of device_type to a dict of device file to the (original name, refs)
+    # of the groups that write it
+    index = {}
+    for device_type, value, tol, refs, _, device, original in packages:
+      conv.packages.append((device_type, value, tol, refs))
+      conv.devices[device_type] = device
+      index.setdefault(device_type, {}).setdefault(device, []).append(
+        (original, refs))
+    for device_type, devices in index.items():
+      if len(devices) > 1:
+        conv.collisions.append(('device', None, device_type, [
+          group for groups in devices.values() for group in groups]))
+
+  def collect_nets(self, conv, nl):
+    # Adds the nets of a Netlist to a Conversion. Net names are indexed as
+    # they're converted, to find distinct nets that end up with the same name.
+    index = {}
+    net = self.enc.net
+    for n in nl.nets:
+      name = net(n.name)
+      index.setdefault(name, n.name)
+      conv.nets.append((name, ['%s.%s' % node for node in n.nodes]))
+    if len(index) != len(conv.nets):
+      # Some names collide; collect all the nets of each colliding name
+      collisions = {}
+      for n, (name, _) in zip(nl.nets, conv.nets):
+        collisions.setdefault(name, []).append(n.name)
+      for name, originals in collisions.items():
+        if len(originals) > 1:
+          conv.collisions.append(('net', None, name, originals))
+
+  def collect_rooms(self, conv, nl):
+    # Adds the ROOM of each component of a Netlist to a Conversion.
+    rooms = {}
+    for comp in nl.components:
+      # Exclude parts whose definitions were previously excluded
+      if comp.libpart.pins is None:
+        continue
+      # Use the sheet path as ROOM, if not otherwise specified.
+      # This is the only way to enable placing by page, since the Telesis
+      # format doesn't enable specifying page numbers in addition to ROOM
+      # definitions.
+      room = self.enc.text(comp.get_field('ROOM') or comp.sheetpath)
+      if room:
+        rooms.setdefault(room, []).append(comp.ref)
+    conv.rooms = sorted(rooms.items(), key=lambda s: s[0].strip("'"))
+
+  def generate_packages(self, component_groups):
+    # Generates the packages of all the component groups (see timed_package),
+    # in parallel if requested. Results are always returned in component group
+    # order.
+    jobs = self.options.jobs
+    if jobs <= 1:
+      return [self.timed_package(grp) for grp in component_groups]
+    # Worker processes are forked, so they inherit the netlist and don't need to
+    # reload it; platforms that can't fork fall back to threads.
+    global _worker_state
+    _worker_state = (self, component_groups)
+    sys.stdout.flush()
+    if 'fork' in multiprocessing.get_all_start_methods():
+      pool = concurrent.futures.ProcessPoolExecutor(
+        jobs, mp_context=multiprocessing.get_context('fork'))
+    else:
+      pool = concurrent.futures.ThreadPoolExecutor(jobs)
+    try:
+      with pool:
+        return list(pool.map(
+          _generate_package_at, range(len(component_groups)),
+          chunksize=max(1, len(component_groups) // (jobs * 4))))
+    finally:
+      _worker_state = None
+
+  def timed_package(self, grp):
+    # Generates the package for a component group (see generate_package),
+    # returning a (seconds taken, result) tuple.
+    start = time.perf_counter()
+    result = self.generate_package(grp)
+    return time.perf_counter() - start, result
+
+  def device_name(self, grp):
+    # Returns the name of a component group's device file, before conversion
+    # into a Telesis device name; see generate_package.
+    return ('%s_%s' % (grp[0].value, grp[0].get_footprint())).rstrip('_')
+
+  def generate_package(self, grp):
+    # Generates the package entry and device file for a component group.
+    # Returns a (device_type, value, tol, refs, footprint, device file,
+    # warnings) tuple, or None if the group doesn't get a package.
+    enc = self.enc
+    # FIXME: what should we do about parts with exclude_from_board set? Most of
+    #        the time these will be BOM items that have no pins, so the
+    #        following no-pin check will do the right thing. But if they have
+    #        pins, do we need to exclude the item *and* remove them from all
+    #        nets? We would need to remove subsequently-empty nets as well?
+    libpart = grp[0].libpart
+    # Don't output components that don't have pins (such as BOM items), as the
+    # Telesis format does not support pinless parts.
+    if libpart.pins is None:
+      return None
+    # Generate the device type, which will be the filename for the device file.
+    # This name needs to be unique not just for the footprint but also for the
+    # properties (at least height, alt footprints, and functions, if not also
+    # value and tolerance), so combine the footprint name with the value to get
+    # something unique. If the footprint field isn't defined (which it probably
+    # isn't in Allegro-centric designs), just use the part name.
+    # With consolidation, value and tolerance are not written into the device
+    # file (since they're overridden in the netlist's component list), and all
+    # the parts that have the same properties share a single device file, named
+    # footprint_i where i indexes into the (consistently sorted) sets of
+    # properties. This significantly reduces the number of device files
+    # generated for resistors and caps, and doesn't create too many additional
+    # files as the design progresses (hashing the properties to generate the
+    # name would create a lot of leftover files in version control as parts
+    # change, so don't do that). The device_type generated here is replaced in
+    # that case.
+    # FIXME: if footprint isn't specified and value is ~ for some reason, this
+    #        will create a "_" file that may collide with other similar mixups!
+    #        Instead of using the part value, maybe the part name in the library
+    #        would be a better choice, or at least a good fallback?
+    device_type = enc.dev(self.device_name(grp))
+    # Telesis format allows for specifying value and tolerance, which is helpful
+    # when looking at designs. The exact field name used to store the value
+    # (resistance, capacitance) depends on the library implementation.
+    # TODO: this list probably needs to be customizable, or perhaps include a
+    #       more exhaustive list of reasonable options more options (val, res,
+    #       cap, L, etc; whatever it seems people are doing).
+    fields = group_field_index(grp)
+    value = get_group_field(enc, fields, ('Spice_Model', 'VALUE'))
+    tol = get_group_field(enc, fields, ('TOLERANCE', 'TOL'))
+    # Write out the corresponding device file
+    with io.StringIO() as d:
+      # We need to pick a reasonable footprint as the default Allegro footprint.
+      # By default we'll use the contents of the Footprint field, with the
+      # leading library name stripped out. This is unlikely to be defined in
+      # Allegro-centric symbol libraries, though, in which case we use the
+      # contents of the footprint filters list as described above.
+      # If nothing is defined, give up and just throw in the device_type string,
+      # which is unlikely to match anything unless you have a very strange
+      # footprint library.
+      # Use the instance's footprint in case it overrides the library's
+      default_footprint, alt_symbols = self.libpart_cache.footprints(
+        libpart, enc, self.cache_stats)
+      if default_footprint is None:
+        default_footprint = device_type
+      # Remove the library name from the footprint, if present
+      footprint = (grp[0].get_footprint()
+                   or default_footprint).rpartition(':')[2]
+      # Write out the chosen default footprint. Additional footprints are
+      # written to the ALT_SYMBOLS property.
+      d.write("PACKAGE '%s'\n" % enc.dev(footprint))
+      # Valid classes are IC, IO, and DISCRETE. This mainly seems to enable
+      # filtering in Quickplace, and BGA Text Out (requires IO) when using APD.
+      # It also seems to affect default pin-swap options when they're not
+      # specified (we fully-specify it so this shouldn't matter).
+      # TODO: heuristically specify IO or DISCRETE, if it doesn't have
+      #       unexpected consequences. IO could be selected when PINSWAP covers
+      #       all pins. DISCRETE could be selected for two-terminal parts.
+      d.write('CLASS IC\n')
+      # Write out library part info
+      d.write('PINCOUNT %u\n' % len(libpart.pins))
+      # Collect functions, if specified
+      functions, pins, warnings = self.libpart_cache.resolve(libpart, [
+        (func, get_group_field(enc, fields, 'func_' + func, sanitize=False))
+        for func in find_group_functions(fields)], self.cache_stats)
+      for func, groups, swap_indices in functions:
+        # Write out the collected function data
+        d.write(format_function(enc, func, groups, swap_indices))
+      # Any pins left over belong to the main group.
+      if pins:
+        d.write(format_function(enc, 'main', [pins]))
+      # Write out properties; there are only a few that are supported.
+      if value and not self.options.consolidate:
+        d.write('PACKAGEPROP VALUE %s\n' % value)
+      if tol and not self.options.consolidate:
+        d.write('PACKAGEPROP TOL %s\n' % tol)
+      # Only write out ALT_SYMBOLS if the footprint wasn't overridden.
+      # This is to avoid mixups and stale footprints if e.g., the designer
+      # overrides an 0402 part with an 0603, or overrides a generic part with a
+      # special footprint for some purpose.
+      if alt_symbols is not None and footprint in (libpart.get_footprint(),
+                                                   default_footprint):
+        # Strip any library names out of the footprint filters.
+        # TODO: implement glob support by searching PSMPATH? this would require
+        #       parsing the Allegro environment files (tcl scripts) and may not
+        #       be realistic to do. Alternatively, could require the designer to
+        #       redundantly specify the psm directory list somewhere, ideally in
+        #       the library.
+        d.write("PACKAGEPROP ALT_SYMBOLS '(%s)'\n" % alt_symbols)
+      # Include any remaining Allegro-recognizable properties
+      # HEIGHT will set the default box height in the 3D view, if the footprint
+      # doesn't have a PACKAGE_HEIGHT_MAX property on a PLACE_BOUND_* shape
+      # TODO: either customize the field mapping to PART_NUMBER and HEIGHT, or
+      #       include a more exhaustive list of reasonable options
+      # TODO: it would be nice if PART_NUMBER could be prepended with the
+      #       manufacturer, if specified
+      for prop in (('PART_NUMBER', 'mpn', 'mfr_pn'), ('HEIGHT',)):
+        data = get_group_field(enc, fields, prop)
+        if data:
+          d.write("PACKAGEPROP %s %s\n" % (prop[0], data))
+      # Done with device file
+      d.write('END\n')
+      return (device_type, value, tol, [c.ref for c in grp],
+              enc.dev(footprint), d.getvalue(), warnings)
+
+def output_paths(output):
+  # Returns the netlist file and device directory paths for an output directory
+  # or netlist file name. KiCad seems to specify .xml for output_dir regardless
+  # of what you did in the file chooser, so handle that case as well.
+  if os.path.isdir(output):
+    dest = os.path.join(output, 'netlist.txt')
+  elif '.' in os.path.basename(output):
+    dest = '%s.txt' % output.rpartition('.')[0]
+  else:
+    dest = '%s.txt' % output
+  # Allegro will search many places for device definition files that are
+  # referenced in the netlist text file. This is configurable (DEVPATH in
+  # Allegro's env), but the default configuration includes the same directory
+  # as the netlist itself, which is the most sensible location for our output.
+  return dest, os.path.join(os.path.dirname(dest), 'devices')
+
+def project_outputs(srcs, output_dir=None):
+  # Returns the output directory of each of several netlists: a directory named
+  # after the netlist in output_dir (which is created), or else the netlist's
+  # own directory. Exits with an error if two netlists would be written to the
+  # same netlist file or device directory.
+  outputs = []
+  seen = {}
+  for i, src in enumerate(srcs):
+    if output_dir:
+      output = os.path.join(output_dir,
+                            os.path.splitext(os.path.basename(src))[0])
+      os.makedirs(output, exist_ok=True)
+    else:
+      output = os.path.dirname(os.path.abspath(src))
+    for path in output_paths(output):
+      other = seen.setdefault(os.path.realpath(path), i)
+      if other != i:
+        sys.stderr.write('%s and %s would both be written to %s\n' % (
+          srcs[other], src, path))
+        sys.exit(1)
+    outputs.append(output)
+  return outputs
+
+class NameCollisionError(Exception):
+  # Raised when distinct names collide once converted to Telesis; see
+  # Conversion.collisions.
+  def __init__(self, conv):
+    super().__init__(conv.collision_report())
+    self.conversion = conv
+
+def convert(src, output=None, options=None, sinks=()):
+  # Converts a KiCad XML netlist (a path or file object) or schematic (a path to
+  # its root .kicad_sch file) into Telesis format, returning a Conversion. The
+  # netlist and device files are only written out if output (an output directory
+  # or netlist file name) is given. Raises NameCollisionError if names collide.
+  # sinks are extra outputs (see bom.py) that are generated from the same
+  # netlist; their statuses end up in Conversion.sink_status.
+  options = options or Options()
+  stats = Stats() if options.stats else None
+  with _phase(stats, 'load'):
+    nl = load_netlist(src)
+  conv = Converter(options).convert(nl, stats)
+  if conv.collisions:
+    raise NameCollisionError(conv)
+  if output is not None:
+    with _phase(stats, 'write'):
+      conv.write(output, options.incremental)
+  if sinks:
+    with _phase(stats, 'sinks'):
+      for sink in sinks:
+        conv.sink_status.append((sink, sink.write(nl, conv)))
+  if stats and (output is not None or sinks):
+    stats.measure_memory()
+  return conv
+
+def add_option_arguments(parser, jobs=True):
+  # Adds the command line flags corresponding to Options to an argparse parser.
+  # jobs: whether to add the --jobs flag
+  parser.add_argument('--escape', action='store_true',
+                      help='escape unsupported characters in names with a '
+                           'reversible encoding instead of replacing them')
+  parser.add_argument('--consolidate', action='store_true',
+                      help='share device files between parts that only '
+                           'differ in value and tolerance')
+  if jobs:
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of workers generating device files in '
+                             'parallel (default: 1, i.e. serially)')
+  parser.add_argument('--incremental', action='store_true',
+                      help='only write out files whose contents changed, and '
+                           'report which device files were added or changed')
+
+def options_from_args(args):
+  # Creates Options from command line flags added by add_option_arguments.
+  return Options(escape=args.escape, consolidate=args.consolidate,
+                 jobs=getattr(args, 'jobs', 1), incremental=args.incremental,
+                 stats=bool(getattr(args, 'stats', None)))
+
+def report_status(conv, prefix=''):
+  # Prints which files were written out by an incremental Conversion.write.
+  for status in ('added', 'changed'):
+    for device_type, s in sorted(conv.device_status.items()):
+      if s == status:
+        print('%s%s device: %s.txt' % (prefix, status, device_type))
+  print('%sdevices: %u added, %u changed, %u unchanged; netlist %s' % (
+    prefix, *(list(conv.device_status.values()).count(s)
+              for s in ('added', 'changed', 'unchanged')),
+    conv.netlist_status))
+
+def main(argv=None):
+  # Process command line arguments.
+  parser = argparse.ArgumentParser(
+    description='Convert a KiCad XML netlist or schematic into an Allegro '
+                '(Telesis) netlist.')
+  parser.add_argument('netlist',
+                      help='KiCad XML netlist, or root .kicad_sch schematic')
+  parser.add_argument('output_dir', help='output directory (or netlist file)')
+  add_option_arguments(parser)
+  bom.add_sink_arguments(parser)
+  parser.add_argument('--stats', nargs='?', const='text',
+                      choices=('text', 'json'),
+                      help='report the time spent in each phase, peak memory, '
+                           'counts, and the slowest component groups, as text '
+                           '(default) or JSON')
+  parser.add_argument('--stats-file',
+                      help='write the --stats report to this file instead of '
+                           'standard output')
+  parser.add_argument('--stats-top', type=int, default=10,
+                      help='number of slowest component groups to report '
+                           '(default: %(default)s)')
+  args = parser.parse_args(argv)
+  if not os.path.isfile(args.netlist):
+    sys.stderr.write('KiCAD netlist not found: %s\n' % args.netlist)
+    sys.exit(1)
+  try:
+    conv = convert(args.netlist, args.output_dir, options_from_args(args),
+                   bom.sinks_from_args(args))
+  except NameCollisionError as e:
+    sys.stderr.write(str(e))
+    sys.exit(1)
+  for warning in conv.warnings:
+    print(warning)
+  # Report what was written out in incremental mode
+  if args.incremental:
+    report_status(conv)
+  for sink, status in conv.sink_status:
+    print('%s %s' % (sink.path, status))
+  if args.stats:
+    if args.stats == 'json':
+      report = json.dumps(conv.stats.to_dict(args.stats_top), indent=2) + '\n'
+    else:
+      report = conv.stats.format_text(args.stats_top)
+    if args.stats_file:
+      with open(args.stats_file, 'w') as f:
+        f.write(report)
+    else:
+      sys.stdout.write(report)
+
+if __name__ == '__main__':
+  main()
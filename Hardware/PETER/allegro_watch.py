@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Google LLC. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Watches KiCad XML netlists (or schematics) and regenerates the Allegro netlist
+# whenever one of them changes, so that the PCB designer can just re-export from
+# KiCad and import into Allegro.
+#
+# The process stays running, so the converters (with their encoding and library
+# part caches) and the parsed schematic sheets stay warm between runs. Output is
+# always written incrementally: only the device files and netlist whose contents
+# changed are rewritten, and these are listed after each run along with the time
+# it took.
+#
+# Changes are detected with inotify on Linux, and by polling the files'
+# modification times and sizes otherwise. Since an export can write a file more
+# than once (or several sheets get saved at once), a run only starts once the
+# files have been quiet for a short debounce period.
+
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+# Import the converter that lives alongside this script.
+sys.dont_write_bytecode = True
+import allegro_netlist
+import kicad_sch
+
+class PollWatcher:
+  # Detects changes to files by polling their modification time and size.
+  def __init__(self, interval=0.25):
+    self.interval = interval
+    # Dict of path to (mtime, size), or None if the file doesn't exist
+    self._stats = {}
+
+  @staticmethod
+  def _stat(path):
+    try:
+      st = os.stat(path)
+    except OSError:
+      return None
+    return st.st_mtime_ns, st.st_size
+
+  def watch(self, paths):
+    # Sets the files to watch.
+    self._stats = {p: self._stats.get(p) or self._stat(p) for p in paths}
+
+  def wait(self, timeout=None):
+    # Waits until some of the files change, or until timeout (in seconds)
+    # passes. Returns the set of changed files, which is empty on timeout.
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+      changed = set()
+      for path, old in self._stats.items():
+        new = self._stat(path)
+        if new != old:
+          self._stats[path] = new
+          changed.add(path)
+      if changed:
+        return changed
+      if deadline is not None:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+          return changed
+        time.sleep(min(self.interval, remaining))
+      else:
+        time.sleep(self.interval)
+
+  def close(self):
+    pass
+
+class InotifyWatcher:
+  # Detects changes to files with Linux's inotify. The directories containing
+  # the files are watched rather than the files themselves, so that files that
+  # are replaced (rather than rewritten in place) are still seen.
+  IN_MODIFY = 0x2
+  IN_CLOSE_WRITE = 0x8
+  IN_MOVED_TO = 0x80
+  IN_CREATE = 0x100
+  _EVENT = struct.Struct('iIII')
+
+  def __init__(self):
+    self._libc = self._load_libc()
+    self._fd = self._libc.inotify_init1(os.O_CLOEXEC)
+    if self._fd < 0:
+      raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+    # Dict of watch descriptor to directory, and directory to descriptor
+    self._dirs = {}
+    self._wds = {}
+    self._files = set()
+
+  @staticmethod
+  def _load_libc():
+    if not sys.platform.startswith('linux'):
+      raise OSError('inotify is only available on Linux')
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    # Raises AttributeError if libc doesn't support inotify
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                       ctypes.c_uint32]
+    return libc
+
+  @classmethod
+  def available(cls):
+    try:
+      cls._load_libc()
+    except (OSError, AttributeError):
+      return False
+    return True
+
+  def watch(self, paths):
+    # Sets the files to watch, adding watches for any new directories.
+    self._files = set(paths)
+    for d in {os.path.dirname(p) for p in paths} - set(self._wds):
+      wd = self._libc.inotify_add_watch(
+        self._fd, os.fsencode(d), self.IN_MODIFY | self.IN_CLOSE_WRITE |
+        self.IN_MOVED_TO | self.IN_CREATE)
+      if wd < 0:
+        raise OSError(ctypes.get_errno(), 'cannot watch %s' % d)
+      self._dirs[wd] = d
+      self._wds[d] = wd
+
+  def wait(self, timeout=None):
+    # Waits until some of the files change, or until timeout (in seconds)
+    # passes. Returns the set of changed files, which is empty on timeout.
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+      remaining = None
+      if deadline is not None:
+        remaining = max(0, deadline - time.monotonic())
+      if not select.select([self._fd], [], [], remaining)[0]:
+        return set()
+      changed = set()
+      data = os.read(self._fd, 64 * 1024)
+      pos = 0
+      while pos < len(data):
+        wd, _, _, length = self._EVENT.unpack_from(data, pos)
+        pos += self._EVENT.size
+        name = os.fsdecode(data[pos:pos + length].rstrip(b'\0'))
+        pos += length
+        path = os.path.join(self._dirs.get(wd, ''), name)
+        if path in self._files:
+          changed.add(path)
+      if changed:
+        return changed
+
+  def close(self):
+    os.close(self._fd)
+
+class Project:
+  # A netlist that is regenerated when it changes.
+  def __init__(self, src, output, options, libpart_cache):
+    self.name = os.path.splitext(os.path.basename(src))[0]
+    self.src = src
+    self.output = output
+    self.converter = allegro_netlist.Converter(options, libpart_cache)
+    # Files the netlist was last read from
+    self.files = {os.path.abspath(src)}
+
+  def regenerate(self, sheet_cache):
+    # Reloads, converts, and writes out the netlist. Returns the Conversion and
+    # the time taken to load, convert, and write, in seconds.
+    start = time.perf_counter()
+    nl = allegro_netlist.load_netlist(self.src, sheet_cache)
+    self.files = {os.path.abspath(f) for f in nl.files} or self.files
+    loaded = time.perf_counter()
+    conv = self.converter.convert(nl)
+    converted = time.perf_counter()
+    if conv.collisions:
+      raise allegro_netlist.NameCollisionError(conv)
+    conv.write(self.output, incremental=True)
+    return conv, (loaded - start, converted - loaded,
+                  time.perf_counter() - converted)
+
+def report(project, conv, times):
+  # Prints the files that were written out by a run, and how long it took.
+  for warning in conv.warnings:
+    print('%s: %s' % (project.name, warning))
+  for device_type, status in sorted(conv.device_status.items()):
+    if status != 'unchanged':
+      print('%s: %s device: %s.txt' % (project.name, status, device_type))
+  written = sum(s != 'unchanged' for s in conv.device_status.values())
+  print('%s: regenerated in %.0f ms (load %.0f ms, convert %.0f ms, '
+        'write %.0f ms); %u of %u device files written, netlist %s' % (
+          project.name, sum(times) * 1000, *(t * 1000 for t in times),
+          written, len(conv.device_status), conv.netlist_status))
+  sys.stdout.flush()
+
+def run(projects, sheet_cache):
+  # Regenerates projects, reporting errors rather than stopping, since the
+  # netlist may be caught in the middle of being written out.
+  for project in projects:
+    try:
+      report(project, *project.regenerate(sheet_cache))
+    except allegro_netlist.NameCollisionError as e:
+      for line in str(e).splitlines():
+        print('%s: %s' % (project.name, line))
+    except Exception as e:
+      print('%s: conversion failed: %s' % (project.name, e))
+  sys.stdout.flush()
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description='Watch KiCad XML netlists or schematics, and regenerate their '
+                'Allegro (Telesis) netlists whenever they change.')
+  parser.add_argument('netlists', nargs='+',
+                      help='KiCad XML netlists, or root .kicad_sch schematics')
+  parser.add_argument('-o', '--output-dir',
+                      help='write each project into a directory named after '
+                           'its netlist here, instead of next to the netlist')
+  parser.add_argument('--poll', action='store_true',
+                      help='poll for changes even if inotify is available')
+  parser.add_argument('--interval', type=float, default=0.25,
+                      help='polling interval in seconds (default: %(default)s)')
+  parser.add_argument('--debounce', type=float, default=0.2,
+                      help='seconds to wait for further changes before '
+                           'regenerating (default: %(default)s)')
+  allegro_netlist.add_option_arguments(parser)
+  args = parser.parse_args(argv)
+  for src in args.netlists:
+    if not os.path.isfile(src):
+      sys.stderr.write('KiCAD netlist not found: %s\n' % src)
+      sys.exit(1)
+  # Output is always written incrementally
+  options = allegro_netlist.options_from_args(args)
+  options.incremental = True
+  libpart_cache = allegro_netlist.LibPartCache()
+  sheet_cache = kicad_sch.SheetCache()
+  projects = [Project(src, output, options, libpart_cache)
+              for src, output in zip(args.netlists,
+                                     allegro_netlist.project_outputs(
+                                       args.netlists, args.output_dir))]
+  if args.poll or not InotifyWatcher.available():
+    watcher = PollWatcher(args.interval)
+  else:
+    watcher = InotifyWatcher()
+  run(projects, sheet_cache)
+  print('watching %u files for changes (%s); press Ctrl-C to stop' % (
+    len(set().union(*(p.files for p in projects))),
+    'polling' if isinstance(watcher, PollWatcher) else 'inotify'))
+  sys.stdout.flush()
+  try:
+    while True:
+      watcher.watch(set().union(*(p.files for p in projects)))
+      changed = watcher.wait()
+      # Wait for the files to settle
+      while True:
+        more = watcher.wait(args.debounce)
+        if not more:
+          break
+        changed |= more
+      run([p for p in projects if p.files & changed], sheet_cache)
+  except KeyboardInterrupt:
+    pass
+  finally:
+    watcher.close()
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Google LLC. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Extra outputs that are generated from the same netlist as the Allegro one, so
+# that a board gets all of its manufacturing files from a single load:
+#   - BomSink writes a grouped bill of materials as CSV, in the same format as
+#     KiCad's BOM export (output/*_BOM*.txt).
+#   - JlcpcbSink syncs the value, footprint, and LCSC part number of each
+#     component into the project database of the kicad-jlcpcb-tools plugin
+#     (jlcpcb/project.db), which the plugin generates the BOM and CPL
+#     (placement) files for JLCPCB from.
+#
+# Sinks are passed to allegro_netlist.convert, which calls their write method
+# with the loaded Netlist and the Conversion once the Allegro netlist has been
+# written out. write returns 'added', 'changed', or 'unchanged', like
+# allegro_netlist.write_file, and a sink never touches its output if nothing
+# changed.
+
+import csv
+import io
+import os
+import sqlite3
+import string
+import sys
+
+# Import the converter that lives alongside this script.
+sys.dont_write_bytecode = True
+import allegro_netlist
+
+# Fields that KiCad's BOM export doesn't list by default, since they already
+# have columns or aren't useful in a BOM
+BOM_SKIP_FIELDS = ('reference', 'value', 'footprint', 'datasheet')
+
+# Names of the field holding the LCSC (JLCPCB) part number, in order of
+# preference. Matched case-insensitively.
+LCSC_FIELDS = ('lcsc', 'lcsc part #', 'lcsc part', 'jlcpcb part #',
+               'jlcpcb part')
+
+# What KiCad puts in a column whose contents differ within a group
+MIXED_VALUES = '-- mixed values --'
+
+def component_fields(c):
+  # Returns a case-insensitive index of the fields of a component, falling back
+  # to the library part, mapping lowercased names to their contents. If
+  # several fields differ only by case, the first one wins.
+  return {name: candidates[0][1] for name, candidates
+          in allegro_netlist.group_field_index([c]).items()}
+
+class BomSink:
+  # Writes a bill of materials. Like KiCad, components are grouped together if
+  # they have the same refdes prefix, DNP state, and group_by fields, and
+  # columns whose contents differ within a group are marked as mixed.
+  # Components that are excluded from the BOM are left out.
+  def __init__(self, path, fields=None, group_by=('Value', 'Footprint')):
+    self.path = path
+    # List of field names to add as columns, or None for all fields that any
+    # component has, in the order they first appear
+    self.fields = fields
+    # Field names (including Value and Footprint) to group components by
+    self.group_by = [name.lower() for name in group_by]
+
+  def columns(self, nl):
+    if self.fields is not None:
+      return list(self.fields)
+    seen = {}
+    for c in nl.components:
+      fields = list(c.fields)
+      if c.libpart:
+        fields += c.libpart.fields
+      for name in fields:
+        if name.lower() not in BOM_SKIP_FIELDS:
+          seen.setdefault(name.lower(), name)
+    return list(seen.values())
+
+  def rows(self, nl):
+    # Returns the header and the rows of the BOM.
+    columns = self.columns(nl)
+    keys = ['value', 'footprint'] + [name.lower() for name in columns]
+    groups = {}
+    for c in nl.components:
+      if 'exclude_from_bom' in c.flags:
+        continue
+      index = component_fields(c)
+      index['value'] = c.value
+      index['footprint'] = c.get_footprint()
+      key = (c.ref.rstrip(string.digits), 'dnp' in c.flags,
+             tuple(index.get(k, '') for k in self.group_by))
+      groups.setdefault(key, []).append(
+        (c.ref, [index.get(k, '') for k in keys]))
+    rows = []
+    for (_, dnp, _), grp in groups.items():
+      grp.sort(key=lambda item: allegro_netlist.natural_sort_key(item[0]))
+      fields = grp[0][1]
+      for _, other in grp[1:]:
+        fields = [a if a == b else MIXED_VALUES for a, b in zip(fields, other)]
+      rows.append([','.join(ref for ref, _ in grp), fields[0], fields[1],
+                   str(len(grp)), 'DNP' if dnp else '', *fields[2:]])
+    rows.sort(key=lambda row: allegro_netlist.natural_sort_key(
+      row[0].partition(',')[0]))
+    return ['Reference', 'Value', 'Footprint', 'Qty', 'DNP', *columns], rows
+
+  def write(self, nl, conv=None):
+    header, rows = self.rows(nl)
+    out = io.StringIO()
+    writer = csv.writer(out, quoting=csv.QUOTE_ALL, lineterminator='\n')
+    writer.writerow(header)
+    writer.writerows(rows)
+    return allegro_netlist.write_file(self.path, out.getvalue(),
+                                      incremental=True)
+
+class JlcpcbSink:
+  # Syncs components into the part_info table of a kicad-jlcpcb-tools project
+  # database. Rows are keyed by reference; the value and footprint always follow
+  # the schematic, and the LCSC part number does too if the schematic has one,
+  # since it may also have been picked in the plugin. Stock and the exclude
+  # flags are left alone for existing parts, which the plugin owns. Parts that
+  # are no longer in the schematic are deleted.
+  # The existing rows are read in one query, and all changes are applied in a
+  # single transaction, so nothing is written if nothing changed.
+  def __init__(self, path):
+    self.path = path
+    # Lists of references added, changed, and removed by the last write
+    self.added = []
+    self.changed = []
+    self.removed = []
+
+  @staticmethod
+  def part(c):
+    # Returns the (value, footprint, lcsc) of a component, with lcsc None if it
+    # isn't set in the schematic.
+    index = component_fields(c)
+    lcsc = next((index[k] for k in LCSC_FIELDS if k in index), None)
+    # The plugin stores footprints without the library name
+    footprint = c.get_footprint().rpartition(':')[2]
+    return c.value, footprint, lcsc
+
+  def write(self, nl, conv=None):
+    db = sqlite3.connect(self.path)
+    try:
+      existing = {row[0]: row[1:] for row in db.execute(
+        'SELECT reference, value, footprint, lcsc FROM part_info')}
+      upserts = []
+      self.added, self.changed = [], []
+      for c in nl.components:
+        if 'exclude_from_board' in c.flags:
+          continue
+        value, footprint, lcsc = self.part(c)
+        old = existing.pop(c.ref, None)
+        if old is not None:
+          if lcsc is None:
+            lcsc = old[2]
+          if (value, footprint, lcsc) == old:
+            continue
+          self.changed.append(c.ref)
+        else:
+          self.added.append(c.ref)
+        exclude = int(bool(c.flags & {'dnp', 'exclude_from_bom'}))
+        upserts.append((c.ref, value, footprint, lcsc or '', '', exclude,
+                        int('dnp' in c.flags)))
+      # Anything left over is no longer in the schematic
+      self.removed = sorted(existing, key=allegro_netlist.natural_sort_key)
+      if not upserts and not self.removed:
+        return 'unchanged'
+      with db:
+        db.executemany(
+          'INSERT INTO part_info (reference, value, footprint, lcsc, stock, '
+          'exclude_from_bom, exclude_from_pos) VALUES (?, ?, ?, ?, ?, ?, ?) '
+          'ON CONFLICT(reference) DO UPDATE SET value=excluded.value, '
+          'footprint=excluded.footprint, lcsc=excluded.lcsc', upserts)
+        db.executemany('DELETE FROM part_info WHERE reference=?',
+                       ((ref,) for ref in self.removed))
+    finally:
+      db.close()
+    return 'changed' if self.changed or self.removed else 'added'
+
+def add_sink_arguments(parser):
+  # Adds the command line flags for the extra outputs to an argparse parser.
+  parser.add_argument('--bom',
+                      help='also write a bill of materials (CSV) to this file')
+  parser.add_argument('--bom-fields',
+                      help='comma-separated fields to add as BOM columns '
+                           '(default: all fields)')
+  parser.add_argument('--bom-group-by', default='Value,Footprint',
+                      help='comma-separated fields to group BOM rows by '
+                           '(default: %(default)s)')
+  parser.add_argument('--jlcpcb-db',
+                      help='also sync part numbers into this '
+                           'kicad-jlcpcb-tools project database '
+                           '(jlcpcb/project.db)')
+
+def sinks_from_args(args):
+  # Creates sinks from command line flags added by add_sink_arguments.
+  sinks = []
+  if args.bom:
+    sinks.append(BomSink(args.bom, args.bom_fields.split(',')
+                         if args.bom_fields else None,
+                         args.bom_group_by.split(',')))
+  if args.jlcpcb_db:
+    if not os.path.isfile(args.jlcpcb_db):
+      sys.stderr.write('JLCPCB project database not found: %s\n' %
+                       args.jlcpcb_db)
+      sys.exit(1)
+    sinks.append(JlcpcbSink(args.jlcpcb_db))
+  return sinks
@@ -0,0 +1,607 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Google LLC. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Reads KiCad schematics (.kicad_sch) directly, so that a netlist can be
+# converted without exporting an XML netlist from eeschema (or kicad-cli) first.
+#
+# Schematic files are S-expressions. They are tokenized with a single regex and
+# built into nested lists one top-level item at a time, skipping over purely
+# graphical items (text, drawings, fonts, strokes) without building them. Each
+# sheet file is then reduced to the parts that matter for a netlist: library
+# symbols, symbol instances, labels, sheets, and the local connectivity between
+# them, which is worked out from the wires, junctions, and pin positions.
+# Reduced sheets are kept in a SheetCache, keyed on the file's modification time
+# and size, so unchanged sheets aren't parsed again. Sheets that are used more
+# than once in the hierarchy are only read once.
+#
+# Nets are then joined across the hierarchy by name: local labels within a
+# sheet instance, hierarchical labels with the pins of their parent's sheet
+# symbol, and global labels and power symbols everywhere. Bus wires themselves
+# aren't followed; instead, a local label that is a member of a bus with a
+# global label on the same sheet (e.g. CPU_A5 with CPU_A[20..0]) is global, so
+# that members of global buses are connected between sheets.
+# Nets are named like eeschema does, by the strongest label on the net: power
+# symbols, then global labels, local labels, hierarchical labels, and sheet
+# pins, with labels higher in the hierarchy winning ties. Other nets are named
+# after one of their pins, e.g. Net-(U1-CLK) or unconnected-(U1-NC-Pad5).
+# This covers the conventions used by our boards, but isn't a complete
+# reimplementation of eeschema's connectivity (e.g. bus aliases and bus groups
+# aren't supported); export an XML netlist if in doubt.
+
+import concurrent.futures
+import os
+import pickle
+import re
+import threading
+import time
+
+# Matches a token: parentheses, a quoted string (group 1), or a bare atom.
+_TOKEN = re.compile(r'[()]|"((?:[^"\\]|\\.)*)"|[^\s()"]+')
+_ESCAPE = re.compile(r'\\(.)')
+# List keywords that are skipped over by the tokenizer, since they don't affect
+# the netlist. Bus wires and entries are skipped as well; see above.
+SKIP = frozenset(('arc', 'bezier', 'bus', 'bus_entry', 'circle', 'effects',
+                  'fill', 'image', 'polyline', 'rectangle', 'stroke', 'text',
+                  'text_box'))
+# Matches a vector bus label, e.g. CPU_A[20..0]
+_BUS_VECTOR = re.compile(r'^(.*)\[(\d+)\.\.(\d+)\]$')
+
+def _unescape(m):
+  c = m.group(1)
+  return '\n' if c == 'n' else c
+
+def parse(text, skip=SKIP):
+  # Yields the items of the top-level list in S-expression text, each as nested
+  # lists of strings. Lists starting with a keyword in skip are dropped.
+  stack = []
+  skipping = 0
+  for m in _TOKEN.finditer(text):
+    tok = m.group()
+    if skipping:
+      if tok == '(':
+        skipping += 1
+      elif tok == ')':
+        skipping -= 1
+    elif tok == '(':
+      stack.append([])
+    elif tok == ')':
+      item = stack.pop()
+      if len(stack) > 1:
+        stack[-1].append(item)
+      elif stack:
+        yield item
+    else:
+      top = stack[-1]
+      if tok[0] == '"':
+        tok = m.group(1)
+        if '\\' in tok:
+          tok = _ESCAPE.sub(_unescape, tok)
+      elif not top and tok in skip:
+        stack.pop()
+        skipping = 1
+        continue
+      top.append(tok)
+
+def _get(item, key):
+  # Returns the first sub-list of item that starts with key, or None.
+  for x in item:
+    if type(x) is list and x and x[0] == key:
+      return x
+  return None
+
+def _value(item, key, default=None):
+  # Returns the first value of the sub-list of item that starts with key.
+  x = _get(item, key)
+  return x[1] if x and len(x) > 1 else default
+
+def _coord(s):
+  # Converts a coordinate in mm into an integer number of schematic units
+  # (0.1 um), so that coordinates can be compared exactly.
+  return round(float(s) * 10000)
+
+def _properties(item):
+  # Returns the properties of a symbol or sheet as an ordered dict.
+  props = {}
+  for x in item:
+    if type(x) is list and x and x[0] == 'property' and len(x) > 2:
+      props.setdefault(x[1], x[2])
+  return props
+
+def _is_hidden(item):
+  # Pins are hidden with a bare hide token (KiCad 7) or a (hide yes) list.
+  return 'hide' in item or _value(item, 'hide') == 'yes'
+
+def _transform(angle, mirror):
+  # Returns the matrix (a, b, c, d) that maps library coordinates (y up) to
+  # schematic coordinates (y down) for a symbol's orientation:
+  #   x' = a*x + b*y, y' = c*x + d*y
+  # Symbols are rotated counter-clockwise, then mirrored.
+  a, b, c, d = {0: (1, 0, 0, 1), 90: (0, -1, 1, 0),
+                180: (-1, 0, 0, -1), 270: (0, 1, -1, 0)}[angle % 360]
+  if mirror == 'x':
+    c, d = -c, -d
+  elif mirror == 'y':
+    a, b = -a, -b
+  return a, b, -c, -d
+
+class LibSymbol:
+  # A library symbol, as cached in a schematic.
+  def __init__(self, item):
+    self.name = item[1]
+    self.power = _get(item, 'power') is not None
+    self.properties = _properties(item)
+    # List of (unit, body style, number, name, type, hidden, x, y) tuples. Unit
+    # and body style are 0 for pins that are common to all units/styles.
+    self.pins = []
+    # Number of units of the symbol
+    self.units = 1
+    for unit in item:
+      if type(unit) is not list or unit[0] != 'symbol':
+        continue
+      _, u, style = unit[1].rsplit('_', 2)
+      self.units = max(self.units, int(u))
+      for pin in unit:
+        if type(pin) is list and pin[0] == 'pin':
+          at = _get(pin, 'at')
+          self.pins.append((int(u), int(style), _value(pin, 'number', ''),
+                            _value(pin, 'name', ''), pin[1], _is_hidden(pin),
+                            _coord(at[1]), _coord(at[2])))
+
+class Symbol:
+  # A symbol placed in a sheet.
+  def __init__(self, item):
+    lib_id = _value(item, 'lib_id', '')
+    # The name of the symbol in the schematic's library symbol cache
+    self.lib_name = _value(item, 'lib_name', lib_id)
+    self.lib, _, self.part = lib_id.rpartition(':')
+    if self.lib_name != lib_id:
+      self.part = self.lib_name.rpartition(':')[2]
+    self.unit = int(_value(item, 'unit', 1))
+    self.body_style = int(_value(item, 'convert',
+                                 _value(item, 'body_style', 1)))
+    self.properties = _properties(item)
+    # Flags of the symbol, named like the properties in an XML netlist
+    self.flags = frozenset(flag for flag, key, value in (
+      ('dnp', 'dnp', 'yes'), ('exclude_from_bom', 'in_bom', 'no'),
+      ('exclude_from_board', 'on_board', 'no')) if _value(item, key) == value)
+    # Dict of instance path (uuids) to (reference, unit) tuples
+    self.instances = {}
+    for project in _get(item, 'instances') or []:
+      for path in project[2:] if type(project) is list else []:
+        self.instances[path[1]] = (_value(path, 'reference'),
+                                   int(_value(path, 'unit', self.unit)))
+    at = _get(item, 'at')
+    self.x = _coord(at[1])
+    self.y = _coord(at[2])
+    self.transform = _transform(int(float(at[3])) if len(at) > 3 else 0,
+                                _value(item, 'mirror'))
+    # List of (number, name, type, hidden, net) tuples, filled in by Sheet
+    self.pins = []
+
+  def reference(self, path):
+    # Returns the (reference, unit) of the symbol in a sheet instance.
+    return self.instances.get(path) or (self.properties.get('Reference', ''),
+                                        self.unit)
+
+class SheetSymbol:
+  # A sheet symbol, which instantiates another sheet file.
+  def __init__(self, item):
+    props = _properties(item)
+    self.uuid = _value(item, 'uuid', '')
+    self.name = props.get('Sheetname', props.get('Sheet name', ''))
+    self.file = props.get('Sheetfile', props.get('Sheet file', ''))
+    # List of (name, x, y) tuples, replaced by (name, net) tuples by Sheet
+    self.pins = [(p[1], _coord(_get(p, 'at')[1]), _coord(_get(p, 'at')[2]))
+                 for p in item if type(p) is list and p[0] == 'pin']
+
+class Sheet:
+  # The netlist-relevant contents of a schematic file. Nets are local to the
+  # sheet and numbered from 0.
+  def __init__(self, text):
+    self.uuid = ''
+    self.lib_symbols = {}
+    self.symbols = []
+    self.sheets = []
+    # List of (kind, name, net) tuples, where kind is the label's keyword
+    self.labels = []
+    wires = []
+    points = []
+    for item in parse(text):
+      kind = item[0]
+      if kind == 'lib_symbols':
+        for x in item[1:]:
+          self.lib_symbols[x[1]] = LibSymbol(x)
+      elif kind == 'symbol':
+        self.symbols.append(Symbol(item))
+      elif kind == 'sheet':
+        self.sheets.append(SheetSymbol(item))
+      elif kind in ('label', 'global_label', 'hierarchical_label'):
+        at = _get(item, 'at')
+        self.labels.append((kind, item[1], (_coord(at[1]), _coord(at[2]))))
+      elif kind == 'wire':
+        (_, x1, y1), (_, x2, y2) = _get(item, 'pts')[1:3]
+        wires.append(((_coord(x1), _coord(y1)), (_coord(x2), _coord(y2))))
+      elif kind == 'junction':
+        at = _get(item, 'at')
+        points.append((_coord(at[1]), _coord(at[2])))
+      elif kind == 'uuid':
+        self.uuid = item[1]
+    # Place the pins of each symbol
+    pins = []
+    for sym in self.symbols:
+      lib = self.lib_symbols.get(sym.lib_name)
+      a, b, c, d = sym.transform
+      for u, style, num, name, type_, hidden, x, y in lib.pins if lib else ():
+        if u in (0, sym.unit) and style in (0, sym.body_style):
+          pins.append((sym, num, name, type_, hidden,
+                       (sym.x + a*x + b*y, sym.y + c*x + d*y)))
+    points.extend(p[-1] for p in pins)
+    points.extend(p for _, _, p in self.labels)
+    points.extend((x, y) for s in self.sheets for _, x, y in s.pins)
+    nets = _connect(wires, points)
+    for sym, num, name, type_, hidden, p in pins:
+      sym.pins.append((num, name, type_, hidden, nets[p]))
+    self.labels = [(kind, name, nets[p]) for kind, name, p in self.labels]
+    for s in self.sheets:
+      s.pins = [(name, nets[(x, y)]) for name, x, y in s.pins]
+    self.net_count = len(set(nets.values()))
+
+def _connect(wires, points):
+  # Works out which points are connected through wires. Wires connect at their
+  # ends, and to any other point that lies on them (such as a junction, a pin,
+  # or the end of another wire). Returns a dict of point to net number.
+  parent = {}
+  def find(p):
+    root = p
+    while parent[root] != root:
+      root = parent[root]
+    while parent[p] != root:
+      parent[p], p = root, parent[p]
+    return root
+  def union(p, q):
+    p, q = find(p), find(q)
+    if p != q:
+      parent[p] = q
+  for p in points:
+    parent[p] = p
+  for p, q in wires:
+    parent.setdefault(p, p)
+    parent.setdefault(q, q)
+  # Index wires by orientation, so that points are only tested against wires on
+  # the same horizontal or vertical line.
+  horizontal = {}
+  vertical = {}
+  diagonal = []
+  for p, q in wires:
+    union(p, q)
+    if p[1] == q[1]:
+      horizontal.setdefault(p[1], []).append((min(p[0], q[0]),
+                                              max(p[0], q[0]), p))
+    elif p[0] == q[0]:
+      vertical.setdefault(p[0], []).append((min(p[1], q[1]),
+                                            max(p[1], q[1]), p))
+    else:
+      diagonal.append((p, q))
+  for p in list(parent):
+    x, y = p
+    for lo, hi, w in horizontal.get(y, ()):
+      if lo < x < hi:
+        union(p, w)
+    for lo, hi, w in vertical.get(x, ()):
+      if lo < y < hi:
+        union(p, w)
+    for (x1, y1), (x2, y2) in diagonal:
+      if ((x - x1) * (y2 - y1) == (y - y1) * (x2 - x1) and
+          min(x1, x2) < x < max(x1, x2)):
+        union(p, (x1, y1))
+  numbers = {}
+  return {p: numbers.setdefault(find(p), len(numbers)) for p in parent}
+
+def read_sheet(path):
+  # Reads a schematic file into a Sheet.
+  with open(path, encoding='utf-8') as f:
+    return Sheet(f.read())
+
+class SheetCache:
+  # Caches Sheets by path, as long as the file's modification time and size
+  # don't change. The cache can be saved to and loaded from a file, so that it
+  # persists between runs.
+  VERSION = 3
+
+  def __init__(self):
+    # Dict of absolute path to ((mtime, size), Sheet)
+    self._sheets = {}
+    self.hits = 0
+    self.misses = 0
+    self._lock = threading.Lock()
+    # Dict of (absolute path, (mtime, size)) to a Future of the Sheet, for
+    # sheets that are being read, so that threads wait for the sheet rather
+    # than reading it again
+    self._reading = {}
+
+  def get(self, path):
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size)
+    with self._lock:
+      entry = self._sheets.get(path)
+      if entry and entry[0] == key:
+        self.hits += 1
+        return entry[1]
+      future = self._reading.get((path, key))
+      reading = future is None
+      if reading:
+        self.misses += 1
+        future = self._reading[path, key] = concurrent.futures.Future()
+      else:
+        self.hits += 1
+    if not reading:
+      # Another thread is already reading the sheet
+      return future.result()
+    try:
+      sheet = read_sheet(path)
+    except BaseException as e:
+      with self._lock:
+        del self._reading[path, key]
+      future.set_exception(e)
+      raise
+    with self._lock:
+      del self._reading[path, key]
+      self._sheets[path] = (key, sheet)
+    future.set_result(sheet)
+    return sheet
+
+  def load(self, path):
+    # Loads cached sheets from a file saved by save(). A missing, unreadable, or
+    # outdated file just results in an empty cache.
+    try:
+      with open(path, 'rb') as f:
+        version, sheets = pickle.load(f)
+    except Exception:
+      return
+    if version == self.VERSION:
+      self._sheets.update(sheets)
+
+  def save(self, path):
+    with open(path + '.tmp', 'wb') as f:
+      pickle.dump((self.VERSION, self._sheets), f, pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.tmp', path)
+
+def bus_members(name):
+  # Returns the members of a vector bus label, or None if it's not a bus.
+  m = _BUS_VECTOR.match(name)
+  if not m:
+    return None
+  start, end = int(m.group(2)), int(m.group(3))
+  step = 1 if end >= start else -1
+  return ['%s%u' % (m.group(1), i) for i in range(start, end + step, step)]
+
+def unit_letter(unit):
+  # Returns the letter(s) eeschema suffixes references with for a unit: A to Z,
+  # then AA, AB, and so on.
+  out = ''
+  while unit > 0:
+    unit, letter = divmod(unit - 1, 26)
+    out = chr(ord('A') + letter) + out
+  return out
+
+def escape_net_name(t):
+  # Escapes a string for use in a net name, like eeschema's EscapeString with
+  # CTX_NETNAME: / would look like a sheet path separator, so it becomes
+  # {slash}, and line breaks are dropped.
+  return t.replace('/', '{slash}').replace('\n', '').replace('\r', '')
+
+def default_net_name(ref, unit, num, name, sym_pins, unconnected):
+  # Names a net after one of its pins, like eeschema does. unit is the unit
+  # letter of the symbol, or empty if its library symbol only has one unit.
+  if name == '~':
+    name = ''
+  out = '%s-(%s' % ('unconnected' if unconnected else 'Net', ref)
+  multiple = not unconnected and any(
+    p[1] == name and p[0] != num for p in sym_pins)
+  if name and name != num and not multiple:
+    # Pin names might not be unique between units, so the unit is included
+    out += '%s-%s' % (unit, escape_net_name(name))
+    return out + ('-Pad%s)' % escape_net_name(num) if unconnected else ')')
+  # Pin numbers are unique, so the unit is left out
+  return '%s-Pad%s)' % (out, escape_net_name(num))
+
+# Net driver priorities; the highest priority label on a net names it.
+PIN, SHEET_PIN, HIERARCHICAL_LABEL, LOCAL_LABEL, GLOBAL_LABEL, POWER = range(6)
+
+class Schematic:
+  # A netlist read from a hierarchy of schematic files.
+  def __init__(self, path, cache=None):
+    self.cache = cache or SheetCache()
+    self.source = os.path.abspath(path)
+    # List of (ref, value, footprint, fields, lib, part, sheet path, flags)
+    # tuples
+    self.components = []
+    # List of (lib, part, fields, footprint filters, pins) tuples, where pins
+    # are (number, name) tuples. Footprint filters are None if not specified.
+    self.libparts = []
+    # List of (name, nodes) tuples, with nodes as (ref, pin number) tuples
+    self.nets = []
+    # List of (sheet path, sheet path of uuids, Sheet) tuples
+    self.instances = []
+    self._read_hierarchy()
+    self.date = time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(max(
+      os.stat(f).st_mtime for f in self.files)))
+    self._build()
+
+  def _read_hierarchy(self):
+    root = self.cache.get(self.source)
+    self.files = [self.source]
+    stack = [(self.source, '/', '/' + root.uuid, root, ())]
+    while stack:
+      path, names, uuids, sheet, parents = stack.pop()
+      self.instances.append((names, uuids, sheet))
+      for s in reversed(sheet.sheets):
+        child = os.path.join(os.path.dirname(path), s.file)
+        if child in parents + (path,):
+          raise ValueError('recursive sheet: %s' % child)
+        if child not in self.files:
+          self.files.append(child)
+        stack.append((child, '%s%s/' % (names, s.name),
+                      '%s/%s' % (uuids, s.uuid), self.cache.get(child),
+                      parents + (path,)))
+
+  def _build(self):
+    # Nets are joined with a union-find over sheet-local nets, identified by
+    # (instance index, net), and label names.
+    parent = {}
+    def find(n):
+      parent.setdefault(n, n)
+      root = n
+      while parent[root] != root:
+        root = parent[root]
+      while parent[n] != root:
+        parent[n], n = root, parent[n]
+      return root
+    def union(n, m):
+      n, m = find(n), find(m)
+      if n != m:
+        parent[n] = m
+    # List of (node, priority, depth, name) net name candidates
+    drivers = []
+    # List of (node, ref, pin number, pin name, symbol pins)
+    pins = []
+    components = {}
+    libparts = {}
+    # Sheet paths (uuids) of instances, for connecting sheet pins
+    instance_paths = {uuids: i for i, (_, uuids, _) in
+                      enumerate(self.instances)}
+    for i, (names, uuids, sheet) in enumerate(self.instances):
+      depth = names.count('/') - 1
+      global_members = set()
+      for kind, name, net in sheet.labels:
+        if kind == 'global_label':
+          global_members.update(bus_members(name) or ())
+      for kind, name, net in sheet.labels:
+        node = (i, net)
+        if bus_members(name) is not None:
+          # Bus labels only name buses, which aren't followed
+          continue
+        if kind == 'global_label' or name in global_members:
+          union(node, ('global', name))
+          drivers.append((node, GLOBAL_LABEL, depth, name))
+        elif kind == 'label':
+          union(node, ('local', i, name))
+          drivers.append((node, LOCAL_LABEL, depth, names + name))
+        else:
+          union(node, ('hierarchical', i, name))
+          drivers.append((node, HIERARCHICAL_LABEL, depth, names + name))
+      for s in sheet.sheets:
+        child = instance_paths['%s/%s' % (uuids, s.uuid)]
+        for name, net in s.pins:
+          union((i, net), ('hierarchical', child, name))
+          drivers.append(((i, net), SHEET_PIN, depth,
+                          '%s%s/%s' % (names, s.name, name)))
+      for sym in sheet.symbols:
+        lib = sheet.lib_symbols.get(sym.lib_name)
+        ref, unit = sym.reference(uuids)
+        unit = unit_letter(unit) if lib and lib.units > 1 else ''
+        for num, name, type_, hidden, net in sym.pins:
+          node = (i, net)
+          if lib.power and type_ == 'power_in':
+            # Power symbols connect their net to the one named by their value.
+            # Power flags (PWR_FLAG) have a power output pin instead, and only
+            # mark nets as driven for ERC.
+            value = sym.properties.get('Value', name)
+            union(node, ('global', value))
+            drivers.append((node, POWER, depth, value))
+          elif type_ == 'power_in' and hidden:
+            # So do hidden power input pins, by their pin name
+            union(node, ('global', name))
+            drivers.append((node, POWER, depth, name))
+          if not ref.startswith('#'):
+            pins.append((node, ref, unit, num, name, sym.pins))
+        if ref.startswith('#') or ref in components:
+          continue
+        props = sym.properties
+        components[ref] = (
+          ref, props.get('Value', ''), props.get('Footprint', ''),
+          {k: v for k, v in props.items()
+           if k not in ('Reference', 'Value') and not k.startswith('ki_')},
+          sym.lib, sym.part, names, sym.flags)
+        if lib and (sym.lib, sym.part) not in libparts:
+          libparts[sym.lib, sym.part] = (
+            sym.lib, sym.part,
+            {k: v for k, v in lib.properties.items()
+             if not k.startswith('ki_')},
+            lib.properties['ki_fp_filters'].split()
+            if 'ki_fp_filters' in lib.properties else None,
+            _unique_pins(lib))
+    self.components = list(components.values())
+    self.libparts = list(libparts.values())
+    # Collect the pins of each net, and pick the name of each net
+    nets = {}
+    for node, ref, _, num, name, _ in pins:
+      nodes = nets.setdefault(find(node), [])
+      if (ref, num) not in nodes:
+        nodes.append((ref, num))
+    names = {}
+    for node, priority, depth, name in drivers:
+      root = find(node)
+      best = names.get(root)
+      if best is None or (-priority, depth, name) < best:
+        names[root] = (-priority, depth, name)
+    pin_names = {}
+    for node, ref, unit, num, name, sym_pins in pins:
+      root = find(node)
+      if root not in names:
+        name = default_net_name(ref, unit, num, name, sym_pins,
+                                len(nets[root]) == 1)
+        if name < pin_names.get(root, name + '￿'):
+          pin_names[root] = name
+    self.nets = [(names[root][2] if root in names else pin_names[root], nodes)
+                 for root, nodes in nets.items()]
+
+def _unique_pins(lib):
+  # Lists the (number, name) of each pin of a library symbol once, including
+  # pins common to several units but not alternate body styles.
+  pins = {}
+  for u, style, num, name, _, _, _, _ in lib.pins:
+    if style in (0, 1):
+      pins.setdefault(num, name)
+  return list(pins.items())
+
+
+# Reads schematics and prints a summary of each, along with the time taken.
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser(
+    description='Read KiCad schematics and summarize their netlists.')
+  parser.add_argument('schematics', nargs='+', help='root .kicad_sch files')
+  parser.add_argument('--repeat', type=int, default=1,
+                      help='number of times to read each schematic, reusing '
+                           'the sheet cache')
+  args = parser.parse_args()
+  cache = SheetCache()
+  for path in args.schematics:
+    for _ in range(args.repeat):
+      start = time.perf_counter()
+      sch = Schematic(path, cache)
+      elapsed = time.perf_counter() - start
+      print('%s: %u sheets, %u components, %u nets in %.3f s' % (
+        path, len(sch.instances), len(sch.components), len(sch.nets), elapsed))
+  print('sheet cache: %u hits, %u misses' % (cache.hits, cache.misses))
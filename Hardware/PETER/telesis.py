@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Google LLC. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Routines to convert strings into various Telesis-safe output.
+# Character safety rules (discovered by trial and error):
+# ! and ' in strings will cause errors even if they're 'quoted'.
+# Non-ASCII characters will also cause errors.
+# Strings that include spaces, +, -, or . need to be 'quoted'.
+# Device names cannot include spaces, +, -, /, or .
+#
+# The same net, pin, and device names are converted over and over again while
+# writing out a netlist, so conversions are memoized in a bounded cache.
+#
+# By default, unsupported characters are replaced (with ? or _), which means
+# that similar strings can be mapped to each other (e.g., the values 4.7k and
+# 4_7k both produce the device name 4_7k). The reversible encoding instead
+# escapes unsupported characters as their hex code point, prefixed by an escape
+# character (? for text and pins, _ for device names). A doubled escape
+# character stands for itself. For example, 4.7k becomes the device 4_2e7k and
+# 4_7k becomes 4__7k. Values that need more than two hex digits are written as
+# U followed by six hex digits. The decode_* functions reverse the encoding.
+# Note that net names and device names are still case-insensitive.
+#
+# Telesis netlists and device files can also be read back in (e.g., to compare
+# outputs, or to read a netlist exported by Allegro).
+
+import functools
+import re
+import sys
+import time
+
+# Default maximum number of memoized results, per conversion
+CACHE_SIZE = 1 << 16
+
+_TEXT_REPLACE = re.compile("[!']|[^ -~]")
+_TEXT_ESCAPE = re.compile("[!'?]|[^ -~]")
+_TEXT_QUOTE = re.compile('[^a-zA-Z0-9_/]')
+_DEV_REPLACE = re.compile('[^a-z0-9_-]')
+_DEV_ESCAPE = re.compile('[^a-z0-9-]')
+_PIN_REPLACE = re.compile('[^A-Za-z0-9_+?/-]')
+_PIN_ESCAPE = re.compile('[^A-Za-z0-9_+/-]')
+
+def _escape(pattern, esc, t, upper):
+  # Escapes every character matched by pattern using the escape character esc.
+  # upper selects the case of the hex digits, to match the case of the output.
+  def escape_char(m):
+    c = m.group()
+    if c == esc:
+      return esc + esc
+    n = ord(c)
+    code = '%02X' % n if n < 0x100 else 'U%06X' % n
+    return esc + (code if upper else code.lower())
+  return pattern.sub(escape_char, t)
+
+def _unescape(esc, t):
+  # Reverses _escape.
+  def unescape_char(m):
+    code = m.group(1)
+    if code == esc:
+      return esc
+    return chr(int(code.lstrip('Uu'), 16))
+  e = re.escape(esc)
+  return re.sub('%s(%s|[Uu][0-9A-Fa-f]{6}|[0-9A-Fa-f]{2})' % (e, e),
+                unescape_char, t)
+
+def decode_text(t):
+  # Decodes a reversibly-encoded text string or net name.
+  if len(t) > 1 and t[0] == t[-1] == "'":
+    t = t[1:-1]
+  return _unescape('?', t)
+
+def decode_dev(t):
+  # Decodes a reversibly-encoded device name.
+  return _unescape('_', t)
+
+def decode_pin(t):
+  # Decodes a reversibly-encoded pin name back into a (name, number) tuple.
+  name, _, num = _unescape('?', t).rpartition('__')
+  return name, num
+
+class Encoder:
+  # Converts strings into Telesis-safe output. Each conversion memoizes up to
+  # cache_size results. If reversible is set, unsupported characters are
+  # escaped rather than replaced; see above.
+  def __init__(self, reversible=False, cache_size=CACHE_SIZE):
+    self.reversible = reversible
+    memoize = functools.lru_cache(maxsize=cache_size)
+    self.text = memoize(self._text)
+    self.net = memoize(self._net)
+    self.dev = memoize(self._dev)
+    self.pin = memoize(self._pin)
+
+  def _text(self, t):
+    # Convert a string into Telesis-safe format. Unsupported characters are
+    # replaced or escaped, and the string is quoted if necessary.
+    if not t:
+      return ''
+    if self.reversible:
+      t = _escape(_TEXT_ESCAPE, '?', t, upper=True)
+    else:
+      t = _TEXT_REPLACE.sub('?', t.replace('\u03BC', 'u'))
+    return f"'{t}'" if _TEXT_QUOTE.search(t) else t
+
+  def _net(self, t):
+    # Converts a string into one safe for a Telesis net name.
+    # Since nets in Allegro are case-insensitive, make them all uppercase to
+    # match Allegro's own output.
+    return self.text(t).upper()
+
+  def _dev(self, t):
+    # Converts a string into one safe for a Telesis device name.
+    # These are all lowercase and have a more restricted set of characters.
+    t = t.lower()
+    if self.reversible:
+      return _escape(_DEV_ESCAPE, '_', t, upper=False)
+    return _DEV_REPLACE.sub('_', t)
+
+  def _pin(self, name, num):
+    # Generates a Telesis-compatible pin name from a pin name and number.
+    # Telesis requires all pin names to be unique, and doesn't have separate
+    # fields for pin number and pin name/function, so we combine them together
+    # to make a unique name that still describes its function if you check pin
+    # info.
+    t = '%s__%s' % (name, num)
+    if self.reversible:
+      return _escape(_PIN_ESCAPE, '?', t, upper=True)
+    return _PIN_REPLACE.sub('?', t)
+
+  def cache_info(self):
+    # Returns the memoization statistics of each conversion.
+    return {name: getattr(self, name).cache_info()
+            for name in ('text', 'net', 'dev', 'pin')}
+
+
+# Matches the head of a statement, up to the first ; that isn't quoted
+_HEAD = re.compile(r"(?:[^';]|'[^']*')*;")
+
+def statements(f):
+  # Yields the statements of a Telesis file (a netlist or device file) from a
+  # file object, reading it a line at a time. Lines continued with a trailing
+  # comma are kept together in one statement. Section markers ($PACKAGES,
+  # $NETS, ...) are statements of their own.
+  lines = []
+  for line in f:
+    line = line.rstrip()
+    lines.append(line)
+    if line.endswith(','):
+      continue
+    st = '\n'.join(lines).strip()
+    lines = []
+    if st:
+      yield st
+  st = '\n'.join(lines).strip()
+  if st:
+    yield st
+
+def split_statement(st):
+  # Splits a netlist statement into the part before the first ; and the part
+  # after it, like str.partition. Quoted names can contain ; themselves.
+  head, sep, rest = st.partition(';')
+  if "'" in head:
+    m = _HEAD.match(st)
+    if not m:
+      return st, '', ''
+    head, sep, rest = st[:m.end() - 1], ';', st[m.end():]
+  return head, sep, rest
+
+def _items(t):
+  # Splits a list of items, which are separated by whitespace or commas.
+  return t.replace(',', ' ').split()
+
+class Netlist:
+  # The contents of a Telesis netlist file.
+  def __init__(self):
+    # Dict of refdes to (device type, value, tolerance)
+    self.packages = {}
+    # Dict of net name to a list of refdes.pin nodes
+    self.nets = {}
+    # Dict of (property, value) to a list of refdes, e.g. ('ROOM', 'CPU')
+    self.properties = {}
+
+def read_netlist(f):
+  # Reads a Telesis netlist from a file object. Statements in the $PACKAGES,
+  # $NETS, and $A_PROPERTIES sections are parsed; anything else is skipped.
+  nl = Netlist()
+  section = None
+  for st in statements(f):
+    if st.startswith('$'):
+      section = st.split()[0].upper()
+      continue
+    head, sep, rest = split_statement(st)
+    if not sep:
+      continue
+    if section == '$PACKAGES':
+      fields = [x.strip() for x in head.split('!')]
+      device_type, value, tol = (fields[1:] + ['', '', ''])[:3]
+      for ref in _items(rest):
+        nl.packages[ref] = (device_type, value, tol)
+    elif section == '$NETS':
+      nl.nets.setdefault(head.strip(), []).extend(_items(rest))
+    elif section == '$A_PROPERTIES':
+      prop, _, value = head.strip().partition(' ')
+      nl.properties.setdefault((prop, value.strip()), []).extend(_items(rest))
+  return nl
+
+class Device:
+  # The contents of a Telesis device file.
+  def __init__(self):
+    self.package = ''
+    self.device_class = ''
+    self.pincount = ''
+    # Dicts of function name to the list of pin names in PINORDER and PINSWAP
+    self.pinorder = {}
+    self.pinswap = {}
+    # Dict of function instance name to (function name, list of pin numbers)
+    self.functions = {}
+    # Dict of PACKAGEPROP name to value
+    self.properties = {}
+
+def read_device(f):
+  # Reads a Telesis device file from a file object.
+  dev = Device()
+  for st in statements(f):
+    keyword, _, rest = st.partition(' ')
+    keyword = keyword.upper()
+    rest = rest.strip()
+    if keyword == 'PACKAGE':
+      dev.package = rest.strip("'")
+    elif keyword == 'CLASS':
+      dev.device_class = rest
+    elif keyword == 'PINCOUNT':
+      dev.pincount = rest
+    elif keyword in ('PINORDER', 'PINSWAP'):
+      name, _, pins = rest.partition(' ')
+      getattr(dev, keyword.lower())[name] = _items(pins)
+    elif keyword == 'FUNCTION':
+      items = _items(rest)
+      if len(items) >= 2:
+        dev.functions[items[0]] = (items[1], items[2:])
+    elif keyword == 'PACKAGEPROP':
+      name, _, value = rest.partition(' ')
+      dev.properties[name] = value.strip()
+  return dev
+
+
+# Measures the encoding throughput on its own, using each line of the input
+# files (or stdin) as a sample string. Each string is converted with all of the
+# conversions, which is representative of how names repeat in a netlist.
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser(
+    description='Measure Telesis encoding throughput.')
+  parser.add_argument('files', nargs='*', help='files of sample strings')
+  parser.add_argument('--reversible', action='store_true',
+                      help='use the reversible encoding')
+  parser.add_argument('--repeat', type=int, default=10,
+                      help='number of passes over the samples')
+  parser.add_argument('--cache-size', type=int, default=CACHE_SIZE,
+                      help='memoization cache size (0 to disable)')
+  args = parser.parse_args()
+  samples = []
+  for name in args.files or ['-']:
+    with (open(name) if name != '-' else sys.stdin) as f:
+      samples.extend(line.rstrip('\n') for line in f)
+  enc = Encoder(args.reversible, args.cache_size)
+  start = time.perf_counter()
+  for _ in range(args.repeat):
+    for s in samples:
+      enc.text(s)
+      enc.net(s)
+      enc.dev(s)
+      enc.pin(s, '1')
+  elapsed = time.perf_counter() - start
+  count = 4 * args.repeat * len(samples)
+  print('%u conversions in %.3f s: %.0f conversions/s' % (
+    count, elapsed, count / elapsed if elapsed else 0))
+  for name, info in enc.cache_info().items():
+    print('%s: %u hits, %u misses, %u cached' % (
+      name, info.hits, info.misses, info.currsize))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Google LLC. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Tests for allegro_backannotate.py. Run with pytest from this directory.
+
+import io
+import os
+import sys
+
+sys.dont_write_bytecode = True
+import allegro_backannotate
+import allegro_netlist
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def annotate(src, options=None):
+  # Converts a netlist, then compares it with its own Telesis netlist as if it
+  # came back from Allegro unchanged.
+  conv = allegro_netlist.convert(src, options=options)
+  nets = allegro_backannotate.read_telesis_nets(io.StringIO(conv.netlist()))
+  nl = allegro_netlist.load_netlist(src)
+  return allegro_backannotate.BackAnnotator(nl, options).compare(nets)
+
+def test_unchanged_netlist():
+  changes, warnings = annotate(os.path.join(HERE, 'PETER.kicad_sch'))
+  assert changes == {'pins': [], 'function_swaps': [], 'pin_swaps': [],
+                     'net_changes': []}
+  assert warnings == []
+
+def test_unchanged_quoted_net_names(tmp_path):
+  # Net names with characters that need quoting in Telesis
+  xml = '''<export version="E">
+<components>
+  <comp ref="R1"><value>1k</value><libsource lib="Device" part="R"/></comp>
+</components>
+<libparts>
+  <libpart lib="Device" part="R"><footprints><fp>R_0603</fp></footprints>
+    <pins><pin num="1" name="~"/><pin num="2" name="~"/></pins></libpart>
+</libparts>
+<nets>
+  <net code="1" name="/Bus/D0 (n)"><node ref="R1" pin="1"/></net>
+  <net code="2" name="+3V3,A"><node ref="R1" pin="2"/></net>
+</nets>
+</export>'''
+  src = tmp_path / 'quoted.xml'
+  src.write_text(xml)
+  for escape in (False, True):
+    options = allegro_netlist.Options(escape=escape)
+    changes, warnings = annotate(str(src), options)
+    assert not any(changes.values())
+    assert warnings == []
+
+# A part with a function of two swappable groups of pins, and four other pins
+SWAPPABLE = '''<export version="E">
+<components>
+  <comp ref="U1"><value>X</value><libsource lib="Device" part="X"/></comp>
+</components>
+<libparts>
+  <libpart lib="Device" part="X"><fields><field name="func_ab">A.*;B.*</field>
+    </fields><pins><pin num="A1" name="A1"/><pin num="A2" name="A2"/>
+    <pin num="B1" name="B1"/><pin num="B2" name="B2"/><pin num="5" name="~"/>
+    <pin num="6" name="~"/><pin num="7" name="~"/><pin num="8" name="~"/>
+    </pins></libpart>
+</libparts>
+<nets>%s</nets>
+</export>''' % ''.join(
+  '<net code="%u" name="N%s"><node ref="U1" pin="%s"/></net>' % (i, pin, pin)
+  for i, pin in enumerate(('A1', 'A2', 'B1', 'B2', '5', '6', '7', '8')))
+
+# What Allegro exports after swapping groups A and B, rotating pins 5, 6, and
+# 7, and moving pin 8 to another net
+SWAPPED = '''$PACKAGES
+!X!X;U1
+$NETS
+NB1 ; U1.A1
+NB2 ; U1.A2
+NA1 ; U1.B1
+NA2 ; U1.B2
+N6 ; U1.5
+N7 ; U1.6
+N5 ; U1.7
+OTHER ; U1.8
+$END
+'''
+
+def compare_swapped(tmp_path, report=''):
+  src = tmp_path / 'swappable.xml'
+  src.write_text(SWAPPABLE)
+  nl = allegro_netlist.load_netlist(str(src))
+  nets = allegro_backannotate.read_telesis_nets(io.StringIO(SWAPPED))
+  reported = allegro_backannotate.read_swap_report(io.StringIO(report))
+  return allegro_backannotate.BackAnnotator(nl).compare(nets, reported)
+
+def test_swaps(tmp_path):
+  changes, warnings = compare_swapped(tmp_path)
+  assert len(changes['pins']) == 8
+  assert changes['function_swaps'] == [{
+    'ref': 'U1', 'function': 'AB', 'groups': [1, 2],
+    'pins': [['A1', 'B1'], ['A2', 'B2']], 'reported': False}]
+  # A cycle of three pins takes two swaps
+  assert [s['pins'] for s in changes['pin_swaps']] == [['5', '6'], ['6', '7']]
+  assert changes['net_changes'] == [{
+    'ref': 'U1', 'pin': '8', 'old_net': 'N8', 'new_net': 'OTHER'}]
+  assert warnings == []
+
+def test_swap_report(tmp_path):
+  changes, warnings = compare_swapped(tmp_path, '''
+Function swap U1.A1 U1.B1
+Pin swap U1.5 U1.6
+Pin swap U1.5, U1.8
+''')
+  assert changes['function_swaps'][0]['reported']
+  assert [s['reported'] for s in changes['pin_swaps']] == [True, False]
+  assert warnings == [
+    'reported swap of U1.5 and U1.8 is not in the netlist']
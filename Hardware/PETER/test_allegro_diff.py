@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Google LLC. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Tests for allegro_diff.py. Run with pytest from this directory.
+
+import sys
+
+sys.dont_write_bytecode = True
+import allegro_diff
+
+def test_two_pin_swap_only_moves_pins():
+  old = {'A': ['R201.1', 'R202.1'], 'B': ['R202.2', 'R203.1']}
+  new = {'A': ['R201.1', 'R202.2'], 'B': ['R202.1', 'R203.1']}
+  assert allegro_diff.diff_nets(old, new) == {
+    'added': [], 'removed': [], 'renamed': [], 'split': [], 'merged': [],
+    'moved': [('R202.1', 'A', 'B'), ('R202.2', 'B', 'A')]}
+
+def test_split_and_merge():
+  old = {'A': ['R1.1', 'R2.1', 'R3.1', 'R4.1'], 'B': ['R5.1', 'R6.1']}
+  new = {'A': ['R1.1', 'R2.1'], 'C': ['R3.1', 'R4.1', 'R5.1', 'R6.1']}
+  changes = allegro_diff.diff_nets(old, new)
+  assert changes['split'] == [('A', ['A', 'C'])]
+  assert changes['merged'] == [(['A', 'B'], 'C')]
+  assert changes['removed'] == ['B'] and changes['added'] == ['C']
+
+def test_net_with_replaced_nodes_keeps_its_name():
+  # A net that keeps its name is neither added nor removed, even if all of its
+  # nodes changed, or it was left empty.
+  changes = allegro_diff.diff_nets({'N': ['U1.1', 'R1.1'], 'M': ['R5.1']},
+                                   {'N': ['U2.1', 'R3.1'], 'M': []})
+  assert changes == {
+    'added': [], 'removed': [], 'renamed': [], 'split': [], 'merged': [],
+    'moved': [('R1.1', 'N', None), ('R3.1', None, 'N'), ('R5.1', 'M', None),
+              ('U1.1', 'N', None), ('U2.1', None, 'N')]}
+
+def test_added_removed_and_renamed():
+  changes = allegro_diff.diff_nets({'A': ['R1.1'], 'B': ['R2.1', 'R3.1']},
+                                   {'C': ['R2.1', 'R3.1'], 'D': ['R4.1']})
+  assert changes['renamed'] == [('B', 'C')]
+  assert changes['removed'] == ['A'] and changes['added'] == ['D']
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Google LLC. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Tests for allegro_netlist.py. Run with pytest from this directory.
+
+import io
+import sys
+
+import pytest
+
+sys.dont_write_bytecode = True
+import allegro_netlist
+
+def netlist(components, libparts='', nets=''):
+  # Returns a KiCad XML netlist with the given component, libpart, and net
+  # elements.
+  return io.StringIO('<export version="E"><components>%s</components>'
+                     '<libparts>%s</libparts><nets>%s</nets></export>' % (
+                       components, libparts, nets))
+
+def comp(ref, value, footprint='', fields=None, part='R'):
+  fields = ''.join('<field name="%s">%s</field>' % f
+                   for f in (fields or {}).items())
+  return ('<comp ref="%s"><value>%s</value><footprint>%s</footprint>'
+          '<fields>%s</fields><libsource lib="Device" part="%s"/></comp>' % (
+            ref, value, footprint, fields, part))
+
+def test_group_order_matches_kicad_netlist_reader():
+  # Groups are sorted by the plain string of their first refdes, and keep
+  # netlist order within each group.
+  nl = allegro_netlist.load_netlist(netlist(''.join((
+    comp('J201', 'A'), comp('R10', '1k'), comp('J1001', 'B'),
+    comp('R2', '1k'), comp('R1', '1k')))))
+  groups = [[c.ref for c in grp] for grp in nl.group_components()]
+  assert groups == [['J1001'], ['J201'], ['R10', 'R2', 'R1']]
+
+LED = ('<libpart lib="Device" part="LED"><footprints><fp>LED_0603</fp>'
+       '</footprints><pins><pin num="1" name="K"/><pin num="2" name="A"/>'
+       '</pins></libpart>')
+
+def test_device_collision_between_refdes_prefixes():
+  # D1 and LED1 share a value and footprint, so they get the same device type,
+  # but their MPNs make for different device files.
+  src = netlist(''.join((
+    comp('D1', 'Red', 'LED_0603', {'MPN': 'A'}, 'LED'),
+    comp('D2', 'Red', 'LED_0603', {'MPN': 'A'}, 'LED'),
+    comp('LED1', 'Red', 'LED_0603', {'MPN': 'B'}, 'LED'))), LED)
+  with pytest.raises(allegro_netlist.NameCollisionError) as e:
+    allegro_netlist.convert(src)
+  assert e.value.conversion.collisions == [('device', None, 'red_led_0603', [
+    ('Red_LED_0603', ['D1', 'D2']), ('Red_LED_0603', ['LED1'])])]
+  assert str(e.value) == ("device name collision: red_led_0603 <- "
+                          "'Red_LED_0603' (D1,D2), 'Red_LED_0603' (LED1)\n")
+
+def test_identical_device_files_do_not_collide():
+  src = netlist(''.join((
+    comp('D1', 'Red', 'LED_0603', {'MPN': 'A'}, 'LED'),
+    comp('LED1', 'Red', 'LED_0603', {'MPN': 'A'}, 'LED'))), LED)
+  assert allegro_netlist.convert(src).collisions == []
+
+def test_stats_without_stats_option():
+  # Passing a Stats collects stats even if Options.stats isn't set.
+  nl = allegro_netlist.load_netlist(netlist(comp('D1', 'Red', 'LED_0603',
+                                                 part='LED'), LED))
+  stats = allegro_netlist.Stats()
+  conv = allegro_netlist.Converter().convert(nl, stats)
+  assert conv.stats is stats
+  assert stats.counts['components'] == 1 and stats.counts['packages'] == 1
+  assert set(stats.phases) == {'grouping', 'devices', 'nets', 'rooms'}
+  assert allegro_netlist.Converter().convert(nl).stats is None
+
+def group_fields(components, libfields):
+  # Loads components instantiating a libpart with the given fields, and returns
+  # the field index of their group.
+  libpart = ('<libpart lib="Device" part="R"><fields>%s</fields><pins>'
+             '<pin num="1" name="~"/></pins></libpart>' % ''.join(
+               '<field name="%s">%s</field>' % f for f in libfields))
+  nl = allegro_netlist.load_netlist(netlist(''.join(components), libpart))
+  grp, = nl.group_components()
+  return allegro_netlist.group_field_index(grp)
+
+def field(index, *names):
+  return allegro_netlist.get_group_field(None, index, names, sanitize=False)
+
+def test_field_spelling_precedence():
+  # As given, then upper, lower, and capitalized, then any other spelling.
+  index = group_fields([comp('R1', '1k')], [('Value', 'R'), ('VALUE', 'VV'),
+                                             ('tOl', '5%')])
+  assert field(index, 'VALUE') == 'VV'
+  assert field(index, 'Value') == 'R'
+  assert field(index, 'value') == 'VV'
+  assert field(index, 'TOL') == '5%'
+  assert field(index, 'Spice_Model', 'VALUE') == 'VV'
+  assert field(index, 'Spice_Model') is None
+
+def test_field_override_order():
+  # For the same spelling, the first component wins over the library part,
+  # which wins over the other components. A spelling that matches better wins
+  # regardless of where it is.
+  index = group_fields([comp('R1', '1k', fields={'MPN': 'A'}),
+                        comp('R2', '1k', fields={'MPN': 'B', 'HEIGHT': '1'}),
+                        comp('R3', '1k', fields={'Height': '3'})],
+                       [('MPN', 'L'), ('Height', '2'), ('mfr_pn', 'X')])
+  assert field(index, 'MPN') == 'A'
+  assert field(index, 'HEIGHT') == '1'
+  assert field(index, 'Height') == '2'
+  assert field(index, 'PART_NUMBER', 'mpn', 'mfr_pn') == 'A'
+  index = group_fields([comp('R1', '1k'), comp('R2', '1k', fields={'MPN': 'B'})],
+                       [('MPN', 'L')])
+  assert field(index, 'MPN') == 'L'
+  # Empty fields don't count
+  index = group_fields([comp('R1', '1k', fields={'MPN': ''})], [('MPN', 'L')])
+  assert field(index, 'MPN') == 'L'
+
+def resolve(pins, *specs):
+  # Resolves (function, func_* contents) specs against a library part with the
+  # given (number, name) pins, and returns the functions with pin numbers, the
+  # pin numbers left for the main function, and the warnings.
+  libpart = allegro_netlist.LibPart('Device', 'X', [], {}, None, [
+    allegro_netlist.Pin(num, name) for num, name in pins])
+  functions, main, warnings = allegro_netlist.LibPartCache().resolve(
+    libpart, list(specs))
+  return ([(func, [[p.num for p in group] for group in groups], swap_indices)
+           for func, groups, swap_indices in functions],
+          [p.num for p in main], warnings)
+
+def test_resolve_first_regex_wins_across_groups():
+  # D0 matches both D0 and D.*, and goes to the first group. Within a group,
+  # pins are in the order of the regexes that matched them. Regexes are
+  # case-insensitive.
+  pins = [('1', 'X1'), ('2', 'D1'), ('3', 'X0'), ('4', 'D0'), ('5', 'E')]
+  assert resolve(pins, ('bus', 'D0,x0;D.*,X1')) == (
+    [('bus', [['4', '3'], ['2', '1']], set())], ['5'], [])
+
+def test_resolve_length_mismatch():
+  # The pins of a broken function go back to the main function, after the
+  # other pins and in group order, and later functions can still claim them.
+  pins = [('1', 'C'), ('2', 'A1'), ('3', 'B1'), ('4', 'A2'), ('5', 'D')]
+  warnings = ['group length mismatch in function a',
+              'pattern B.* does not expand to the same number of pins']
+  assert resolve(pins, ('a', 'A.*;B.*')) == (
+    [], ['1', '5', '2', '4', '3'], warnings)
+  assert resolve(pins, ('a', 'A.*;B.*'), ('b', 'A1;A2')) == (
+    [('b', [['2'], ['4']], set())], ['1', '5', '3'], warnings)
+
+def test_resolve_ties_keep_netlist_order():
+  pins = [('9', 'GND'), ('2', 'GND'), ('3', 'VCC'), ('1', 'VCC')]
+  assert resolve(pins, ('pwr', 'GND;VCC')) == (
+    [('pwr', [['9', '2'], ['3', '1']], set())], [], [])
+
+def test_resolve_unnamed_pins():
+  # Pins named ~ (or left empty) match regexes that match ~, and are sorted by
+  # number.
+  pins = [('2', ''), ('1', '~'), ('3', 'A'), ('4', 'B')]
+  assert resolve(pins, ('x', '~;[AB]')) == (
+    [('x', [['1', '2'], ['3', '4']], set())], [], [])
+
+def test_resolve_swap_indices():
+  pins = [(name, name) for name in ('A1', 'A2', 'A3', 'A4',
+                                     'B1', 'B2', 'B3', 'B4')]
+  def swap_indices(text):
+    functions, _, _ = resolve(pins, ('ab', 'A.*;B.*;;' + text))
+    return functions[0][2]
+  assert swap_indices('') == set()
+  assert swap_indices('*') == {0, 1, 2, 3}
+  assert swap_indices('2') == {1}
+  # Ranges are inclusive and clipped to the group size
+  assert swap_indices('1,3-9') == {0, 2, 3}
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Google LLC. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+# Tests for bom.py. Run with pytest from this directory.
+
+import io
+import sqlite3
+import sys
+
+sys.dont_write_bytecode = True
+import allegro_netlist
+import bom
+
+# The part_info table of a kicad-jlcpcb-tools project database
+PART_INFO = ('CREATE TABLE part_info (reference NOT NULL PRIMARY KEY,'
+             'value TEXT NOT NULL,footprint TEXT NOT NULL,lcsc TEXT,'
+             'stock NUMERIC,exclude_from_bom NUMERIC DEFAULT 0,'
+             'exclude_from_pos NUMERIC DEFAULT 0)')
+
+def netlist(*components):
+  # Loads a netlist of (ref, value, footprint, fields, flags) components.
+  xml = ''.join(
+    '<comp ref="%s"><value>%s</value><footprint>%s</footprint><fields>%s'
+    '</fields><libsource lib="Device" part="R"/>%s</comp>' % (
+      ref, value, footprint,
+      ''.join('<field name="%s">%s</field>' % f for f in fields.items()),
+      ''.join('<property name="%s"/>' % flag for flag in flags))
+    for ref, value, footprint, fields, flags in components)
+  return allegro_netlist.load_netlist(io.StringIO(
+    '<export version="E"><components>%s</components><libparts/><nets/>'
+    '</export>' % xml))
+
+def test_bom_groups():
+  # DNP parts are grouped separately, columns that differ within a group are
+  # mixed, and parts excluded from the BOM are left out.
+  nl = netlist(('R1', '10k', 'R:R_0603', {'MPN': 'A'}, ()),
+               ('R2', '10k', 'R:R_0603', {'MPN': 'A'}, ('dnp',)),
+               ('R3', '10k', 'R:R_0603', {'mpn': 'B'}, ()),
+               ('R4', '10k', 'R:R_0603', {}, ('exclude_from_bom',)),
+               ('C1', '1u', 'C:C_0603', {}, ()))
+  header, rows = bom.BomSink(None).rows(nl)
+  assert header == ['Reference', 'Value', 'Footprint', 'Qty', 'DNP', 'MPN']
+  assert rows == [['C1', '1u', 'C:C_0603', '1', '', ''],
+                  ['R1,R3', '10k', 'R:R_0603', '2', '', bom.MIXED_VALUES],
+                  ['R2', '10k', 'R:R_0603', '1', 'DNP', 'A']]
+  # Grouping by MPN as well splits R1 and R3
+  _, rows = bom.BomSink(None, group_by=('Value', 'Footprint', 'MPN')).rows(nl)
+  assert [row[0] for row in rows] == ['C1', 'R1', 'R2', 'R3']
+
+def jlcpcb_db(tmp_path):
+  path = str(tmp_path / 'project.db')
+  db = sqlite3.connect(path)
+  db.execute(PART_INFO)
+  db.commit()
+  db.close()
+  return path
+
+def part_info(path):
+  db = sqlite3.connect(path)
+  try:
+    return {row[0]: row[1:] for row in db.execute(
+      'SELECT reference, value, footprint, lcsc FROM part_info')}
+  finally:
+    db.close()
+
+def contents(path):
+  with open(path, 'rb') as f:
+    return f.read()
+
+def test_jlcpcb_sync(tmp_path):
+  path = jlcpcb_db(tmp_path)
+  sink = bom.JlcpcbSink(path)
+  r1 = ('R1', '10k', 'R:R_0603', {'LCSC': 'C25804'}, ())
+  c1 = ('C1', '1u', 'C:C_0603', {}, ())
+  assert sink.write(netlist(r1, c1)) == 'added'
+  assert sink.added == ['R1', 'C1']
+  assert part_info(path) == {'R1': ('10k', 'R_0603', 'C25804'),
+                             'C1': ('1u', 'C_0603', '')}
+  # Nothing is written if nothing changed (SQLite bumps a change counter in the
+  # file header on every write)
+  before = contents(path)
+  assert sink.write(netlist(r1, c1)) == 'unchanged'
+  assert contents(path) == before
+  # A changed value is updated
+  assert sink.write(netlist(r1, ('C1', '2u2', 'C:C_0603', {}, ()))) == 'changed'
+  assert sink.changed == ['C1'] and sink.removed == []
+  assert part_info(path)['C1'] == ('2u2', 'C_0603', '')
+  # Components no longer in the schematic are deleted
+  assert sink.write(netlist(r1)) == 'changed'
+  assert sink.removed == ['C1']
+  assert part_info(path) == {'R1': ('10k', 'R_0603', 'C25804')}
+
+def test_jlcpcb_keeps_plugin_lcsc(tmp_path):
+  # A part number picked in the plugin is kept if the schematic has none, but
+  # one in the schematic wins.
+  path = jlcpcb_db(tmp_path)
+  sink = bom.JlcpcbSink(path)
+  r1 = ('R1', '10k', 'R:R_0603', {}, ())
+  assert sink.write(netlist(r1)) == 'added'
+  db = sqlite3.connect(path)
+  with db:
+    db.execute("UPDATE part_info SET lcsc='C25804' WHERE reference='R1'")
+  db.close()
+  assert sink.write(netlist(r1)) == 'unchanged'
+  assert part_info(path) == {'R1': ('10k', 'R_0603', 'C25804')}
+  assert sink.write(netlist(('R1', '10k', 'R:R_0603', {'LCSC Part #': 'C1'},
+                             ()))) == 'changed'
+  assert part_info(path) == {'R1': ('10k', 'R_0603', 'C1')}
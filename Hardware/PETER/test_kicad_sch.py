@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Google LLC. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Tests for kicad_sch.py. Run with pytest from this directory.
+
+import sys
+
+sys.dont_write_bytecode = True
+import kicad_sch
+
+# A resistor whose pins end 3.81 mm above and below its origin
+LIB_R = '''(symbol "Device:R" (property "Reference" "R")
+  (symbol "R_1_1"
+    (pin passive line (at 0 3.81 270) (length 1.27)
+      (name "~") (number "1"))
+    (pin passive line (at 0 -3.81 90) (length 1.27)
+      (name "~") (number "2"))))'''
+
+def resistor(ref, x, y):
+  # Returns a resistor placed so that pin 1 ends at (x, y), and pin 2 at
+  # (x, y + 7.62).
+  return ('(symbol (lib_id "Device:R") (at %s %s 0) (unit 1) '
+          '(property "Reference" "%s") (property "Value" "1k") '
+          '(property "Footprint" "R_0603"))' % (x, y + 3.81, ref))
+
+def write_sheet(path, *items, uuid='root'):
+  with open(path, 'w') as f:
+    f.write('(kicad_sch (version 20231120) (generator "eeschema") '
+            '(uuid "%s") (lib_symbols %s) %s)' % (uuid, LIB_R, ' '.join(items)))
+  return str(path)
+
+def wire(x1, y1, x2, y2):
+  return '(wire (pts (xy %s %s) (xy %s %s)))' % (x1, y1, x2, y2)
+
+def label(kind, name, x, y):
+  return '(%s "%s" (at %s %s 0))' % (kind, name, x, y)
+
+def nets_of(path, cache=None):
+  # Returns a dict of (ref, pin) to net name.
+  sch = kicad_sch.Schematic(path, cache)
+  return {node: name for name, nodes in sch.nets for node in nodes}
+
+def test_unit_letter():
+  assert [kicad_sch.unit_letter(u) for u in (1, 2, 26, 27, 52, 53)] == [
+    'A', 'B', 'Z', 'AA', 'AZ', 'BA']
+
+def test_default_net_name():
+  # (number, name) of the pins of a unit
+  pins = [('1', 'PA0'), ('2', 'GND'), ('3', 'GND'), ('4', '~'), ('5', '5')]
+  name = kicad_sch.default_net_name
+  assert name('U1', 'B', '1', 'PA0', pins, False) == 'Net-(U1B-PA0)'
+  assert name('U1', 'B', '1', 'PA0', pins, True) == (
+    'unconnected-(U1B-PA0-Pad1)')
+  assert name('R1', '', '1', 'PA0', pins, False) == 'Net-(R1-PA0)'
+  # Pins that aren't named, or whose names aren't unique, go by number
+  assert name('U1', 'B', '2', 'GND', pins, False) == 'Net-(U1-Pad2)'
+  assert name('U1', 'B', '4', '~', pins, True) == 'unconnected-(U1-Pad4)'
+  assert name('U1', 'B', '5', '5', pins, False) == 'Net-(U1-Pad5)'
+  # / is escaped, since it separates sheets in net names
+  assert name('U1', 'B', '6', 'PC5/DSR1', pins, True) == (
+    'unconnected-(U1B-PC5{slash}DSR1-Pad6)')
+
+def test_wire_connects_at_ends_and_midpoints(tmp_path):
+  # R1 touches the middle of the wire, R2 its end; R3 is off the wire.
+  nets = nets_of(write_sheet(
+    tmp_path / 'root.kicad_sch', wire(0, 20, 40, 20), resistor('R1', 20, 20),
+    resistor('R2', 40, 20), resistor('R3', 60, 20)))
+  assert nets['R1', '1'] == nets['R2', '1']
+  assert nets['R1', '1'] != nets['R3', '1']
+  # Named after the pin that sorts first
+  assert nets['R1', '1'] == 'Net-(R1-Pad1)'
+  assert nets['R3', '1'] == 'unconnected-(R3-Pad1)'
+
+def test_crossing_wires_need_a_junction(tmp_path):
+  crossing = (wire(0, 20, 40, 20), wire(20, 0, 20, 40), resistor('R1', 0, 20),
+              resistor('R2', 20, 0))
+  nets = nets_of(write_sheet(tmp_path / 'a.kicad_sch', *crossing))
+  assert nets['R1', '1'] != nets['R2', '1']
+  nets = nets_of(write_sheet(tmp_path / 'b.kicad_sch', *crossing,
+                             '(junction (at 20 20))'))
+  assert nets['R1', '1'] == nets['R2', '1']
+
+def test_local_and_global_labels(tmp_path):
+  # Each sheet has a local label SIG and a global label G. Local labels only
+  # connect within their sheet; global labels connect across sheets.
+  def sheet_items(ref1, ref2):
+    return (resistor(ref1, 0, 20), label('label', 'SIG', 0, 20),
+            resistor(ref2, 40, 20), label('global_label', 'G', 40, 20))
+  write_sheet(tmp_path / 'child.kicad_sch', *sheet_items('R3', 'R4'),
+              uuid='child')
+  root = write_sheet(
+    tmp_path / 'root.kicad_sch', *sheet_items('R1', 'R2'),
+    resistor('R5', 0, 60), label('label', 'SIG', 0, 60),
+    '(sheet (at 100 100) (uuid "s1") (property "Sheetname" "Child") '
+    '(property "Sheetfile" "child.kicad_sch"))')
+  nets = nets_of(root)
+  assert nets['R1', '1'] == nets['R5', '1'] == '/SIG'
+  assert nets['R3', '1'] == '/Child/SIG'
+  assert nets['R2', '1'] == nets['R4', '1'] == 'G'
+
+def test_hierarchical_label_joins_sheet_pin(tmp_path):
+  write_sheet(tmp_path / 'child.kicad_sch', resistor('R2', 0, 20),
+              label('hierarchical_label', 'H', 0, 20), uuid='child')
+  root = write_sheet(
+    tmp_path / 'root.kicad_sch', wire(0, 20, 100, 20), resistor('R1', 0, 20),
+    '(sheet (at 100 10) (uuid "s1") (property "Sheetname" "Child") '
+    '(property "Sheetfile" "child.kicad_sch") (pin "H" input (at 100 20 0)))')
+  nets = nets_of(root)
+  assert nets['R1', '1'] == nets['R2', '1'] == '/Child/H'
+  assert nets['R1', '2'] != nets['R2', '2']
+  # A local label beats the sheet pin and hierarchical label
+  root = write_sheet(
+    tmp_path / 'root2.kicad_sch', wire(0, 20, 100, 20), resistor('R1', 0, 20),
+    label('label', 'BUS', 50, 20),
+    '(sheet (at 100 10) (uuid "s1") (property "Sheetname" "Child") '
+    '(property "Sheetfile" "child.kicad_sch") (pin "H" input (at 100 20 0)))')
+  nets = nets_of(root)
+  assert nets['R1', '1'] == nets['R2', '1'] == '/BUS'
+
+def test_sheet_cache(tmp_path):
+  path = write_sheet(tmp_path / 'root.kicad_sch', resistor('R1', 0, 20))
+  cache = kicad_sch.SheetCache()
+  nets_of(path, cache)
+  nets_of(path, cache)
+  assert (cache.hits, cache.misses) == (1, 1)
+  # Sheets are read again when they change (here, in size), and the cache
+  # can be saved and loaded
+  write_sheet(path, resistor('R20', 0, 20))
+  assert ('R20', '1') in nets_of(path, cache)
+  assert (cache.hits, cache.misses) == (1, 2)
+  cache.save(str(tmp_path / 'cache'))
+  loaded = kicad_sch.SheetCache()
+  loaded.load(str(tmp_path / 'cache'))
+  assert ('R20', '1') in nets_of(path, loaded)
+  assert (loaded.hits, loaded.misses) == (1, 0)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Google LLC. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Tests for telesis.py. Run with pytest from this directory.
+
+import io
+import sys
+
+sys.dont_write_bytecode = True
+import allegro_netlist
+import telesis
+
+def test_netlist_round_trip():
+  # Writes a netlist with names that need quoting, including ones with ;, and
+  # reads it back.
+  enc = telesis.Encoder()
+  conv = allegro_netlist.Conversion('test.xml', 'today')
+  conv.packages = [(enc.dev('1k_R_0603'), enc.text('1k'), enc.text('5%'),
+                    ['R1', 'R2'])]
+  conv.nets = [(enc.net(name), nodes) for name, nodes in (
+    ('GND', ['R1.1', 'R2.1']), ('/Bus/D0;n', ['R1.2']),
+    ('A;B;C', ['R2.2', 'R3.1', 'R3.2']), ('+3V3', ['R4.1']))]
+  conv.rooms = [(enc.text('CPU;1'), ['R1', 'R2'])]
+  nl = telesis.read_netlist(io.StringIO(conv.netlist()))
+  assert nl.packages == {'R1': ('1k_r_0603', '1k', "'5%'"),
+                         'R2': ('1k_r_0603', '1k', "'5%'")}
+  assert nl.nets == {'GND': ['R1.1', 'R2.1'], "'/BUS/D0;N'": ['R1.2'],
+                     "'A;B;C'": ['R2.2', 'R3.1', 'R3.2'],
+                     "'+3V3'": ['R4.1']}
+  assert nl.properties == {('ROOM', "'CPU;1'"): ['R1', 'R2']}
+
+def test_statements():
+  lines = ['$NETS  \n', "'A;B' ; R1.1,\n", '\tR1.2 \n', '\n', 'C ; R2.1']
+  assert list(telesis.statements(iter(lines))) == [
+    '$NETS', "'A;B' ; R1.1,\n\tR1.2", 'C ; R2.1']